@@ -0,0 +1,123 @@
+import asyncio
+import time
+import traceback
+
+
+class ArchiveJob:
+    __slots__ = ('user_id', 'folder_id', 'name', 'status', 'url', 'error', 'watchers',
+                 'created_at', 'finished_at', 'expires_at')
+
+    def __init__(self, user_id, folder_id, name):
+        self.user_id = user_id
+        self.folder_id = folder_id
+        self.name = name
+        self.status = 'queued'  # queued -> running -> done / failed
+        self.url = None
+        self.error = None
+        self.watchers = []  # (chat_id, message_id) of status messages to update
+        self.created_at = time.time()
+        self.finished_at = None
+        self.expires_at = None
+
+
+class ArchiveJobs:
+    """Builds folder archives in the background, at most `max_running` at a time.
+
+    A request for a folder that is already queued or being archived joins the
+    existing job instead of starting another, and a finished archive is handed
+    out again until `url_ttl` seconds after it was built (kept safely below
+    the 24 hour lifetime of Seedr's archive links).
+    """
+
+    def __init__(self, on_update, max_running=2, url_ttl=23 * 3600, timeout=600, expiry=None):
+        self.on_update = on_update  # async (job, chat_id, message_id), called on start and finish
+        self.url_ttl = url_ttl
+        self.timeout = timeout
+        self.expiry = expiry
+        self._slots = asyncio.Semaphore(max_running)
+        self._active = {}  # (user_id, folder_id) -> queued or running job
+        self._ready = {}  # user_id -> {folder_id: finished job with a live url}
+        self.built = 0
+        self.reused = 0
+        self.joined = 0
+        self.failed = 0
+
+    def submit(self, user_id, account, folder_id, name, chat_id, message_id):
+        """Return the job for this folder, starting one only if nothing usable exists.
+
+        A reusable finished job is returned as-is; otherwise the status message
+        is attached to the job and updated as it progresses.
+        """
+        folder_id = str(folder_id)
+        job = self._ready.get(user_id, {}).get(folder_id)
+        if job is not None and time.time() < job.expires_at:
+            self.reused += 1
+            return job
+
+        key = (user_id, folder_id)
+        job = self._active.get(key)
+        if job is not None:
+            self.joined += 1
+        else:
+            job = self._active[key] = ArchiveJob(user_id, folder_id, name)
+            asyncio.ensure_future(self._run(job, account))
+        job.watchers.append((chat_id, message_id))
+        return job
+
+    async def _run(self, job, account):
+        try:
+            async with self._slots:
+                job.status = 'running'
+                await self._notify(job)
+                try:
+                    response = await account.createArchive(folderId=job.folder_id, timeout=self.timeout)
+                except Exception as e:
+                    response = {'error': str(e) or type(e).__name__}
+        finally:
+            self._active.pop((job.user_id, job.folder_id), None)
+
+        job.finished_at = time.time()
+        if response.get('archive_url'):
+            job.status = 'done'
+            job.url = response['archive_url']
+            job.expires_at = job.finished_at + self.url_ttl
+            self._ready.setdefault(job.user_id, {})[job.folder_id] = job
+            if self.expiry:
+                self.expiry.call_later(self.url_ttl, self._expire, job)
+            self.built += 1
+        else:
+            job.status = 'failed'
+            job.error = response.get('error') or 'no archive link returned'
+            self.failed += 1
+        await self._notify(job)
+
+    async def _notify(self, job):
+        for chat_id, message_id in job.watchers:
+            try:
+                await self.on_update(job, chat_id, message_id)
+            except Exception:
+                traceback.print_exc()
+
+    def _expire(self, job):
+        folders = self._ready.get(job.user_id)
+        if folders and folders.get(job.folder_id) is job:
+            del folders[job.folder_id]
+            if not folders:
+                del self._ready[job.user_id]
+
+    def invalidate_user(self, user_id):
+        """Forget a user's finished archives (their folders changed)"""
+        self._ready.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._active)
+
+    def stats(self):
+        return {
+            'active': len(self._active),
+            'ready': sum(len(folders) for folders in self._ready.values()),
+            'built': self.built,
+            'reused': self.reused,
+            'joined': self.joined,
+            'failed': self.failed,
+        }
@@ -1,22 +1,21 @@
-import json
-import os
 import time
 from pathlib import Path
-from seedrcc import Login
 from cryptography.fernet import Fernet
+from cache import TTLCache
+from metrics import metrics
+from token_store import open_token_store
 
 
 class AuthManager:
-    def __init__(self, storage_file='user_tokens.json', encryption_key=None):
+    def __init__(self, storage_file='user_tokens.json', encryption_key=None, store=None,
+                 token_cache_size=10000, token_cache_ttl=60, expiry=None):
         self.storage_file = Path(storage_file)
         self.encryption_key = encryption_key
         self.fernet = Fernet(encryption_key) if encryption_key else None
-        self._ensure_storage_file()
-
-    def _ensure_storage_file(self):
-        if not self.storage_file.exists():
-            with open(self.storage_file, 'w') as f:
-                json.dump({}, f)
+        self.store = store or open_token_store(storage_file)
+        # Decrypted tokens, so hot paths skip the Fernet HMAC check + AES decrypt
+        self.token_cache = TTLCache(max_entries=token_cache_size, ttl=token_cache_ttl, expiry=expiry)
+        self._change_watchers = []  # sets collecting ids of users whose token changed
 
     def _encrypt(self, data):
         if self.fernet:
@@ -29,60 +28,81 @@ class AuthManager:
         return data
 
     def save_user_token(self, user_id, token):
-        data = self._load_data()
-        data[str(user_id)] = {
-            'token': self._encrypt(token),
-            'last_updated': int(time.time())
-        }
-        self._save_data(data)
+        if token is None:
+            self.delete_user_token(user_id)
+            return
+        self._changed(user_id)
+        self.token_cache.pop(str(user_id))
+        started = metrics.begin('token_store', 'save')
+        error = True
+        try:
+            self.store.put(user_id, {
+                'token': self._encrypt(token),
+                'last_updated': int(time.time())
+            })
+            error = False
+        finally:
+            metrics.end('token_store', 'save', started, error)
 
     def get_user_token(self, user_id):
-        data = self._load_data()
-        user_data = data.get(str(user_id))
-        if user_data and 'token' in user_data:
-            return self._decrypt(user_data['token'])
-        return None
+        token = self.token_cache.get(str(user_id))
+        if token is not None:
+            return token
+        started = metrics.begin('token_store', 'load')
+        error = True
+        try:
+            user_data = self.store.get(user_id)
+            if user_data and 'token' in user_data:
+                token = self._decrypt(user_data['token'])
+                self.token_cache.set(str(user_id), token)
+            error = False
+        finally:
+            metrics.end('token_store', 'load', started, error)
+        return token
 
     def delete_user_token(self, user_id):
-        data = self._load_data()
-        if str(user_id) in data:
-            del data[str(user_id)]
-            self._save_data(data)
-            return True
-        return False
-
-    def _load_data(self):
-        try:
-            with open(self.storage_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-
-    def _save_data(self, data):
-        temp_file = f"{self.storage_file}.tmp"
-        with open(temp_file, 'w') as f:
-            json.dump(data, f, indent=2)
-        os.replace(temp_file, self.storage_file)
-
-    def generate_device_code(self):
-        seedr = Login()
-        device_code = seedr.getDeviceCode()
-        return {
-            'login_instance': seedr,
-            'device_code': device_code['device_code'],
-            'user_code': device_code['user_code'],
-            'verification_url': 'https://seedr.cc/devices'
-        }
-
-    def poll_authorization(self, login_instance, device_code):
-        while True:
-            response = login_instance.authorize(device_code)
-
-            if 'access_token' in response:
-                return login_instance.token
-
-            if response.get('error') == 'authorization_pending':
-                time.sleep(5)
-                continue
-
-            raise Exception(f"Authorization failed: {response}")
\ No newline at end of file
+        self._changed(user_id)
+        self.token_cache.pop(str(user_id))
+        return self.store.delete(user_id)
+
+    def recent_tokens(self, max_age=None, limit=None):
+        """Decrypted (user_id, token) pairs of users whose token was saved in the last `max_age` seconds.
+
+        Safe to run off the event loop: it only reads the store.
+        """
+        since = time.time() - max_age if max_age else 0
+        tokens = []
+        for user_id, entry in self.store.recent(since, limit):
+            try:
+                tokens.append((int(user_id), self._decrypt(entry['token'])))
+            except Exception:
+                continue  # undecryptable (key rotated) or malformed entry
+        return tokens
+
+    def _changed(self, user_id):
+        for changed in self._change_watchers:
+            changed.add(str(user_id))
+
+    def watch_changes(self):
+        """Set that collects the ids (as str) of users whose token is saved or deleted from now on"""
+        changed = set()
+        self._change_watchers.append(changed)
+        return changed
+
+    def unwatch_changes(self, changed):
+        self._change_watchers = [watcher for watcher in self._change_watchers if watcher is not changed]
+
+    def remember_token(self, user_id, token, ttl=None):
+        """Put an already decrypted token in the cache, optionally for longer than usual"""
+        self.token_cache.set(str(user_id), token, ttl=ttl)
+
+    # Names used by the bot in main.py
+    save_token = save_user_token
+    get_token = get_user_token
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
+
@@ -0,0 +1,89 @@
+import time
+from poll_scheduler import PollScheduler
+
+
+class AuthPoller:
+    """Polls every pending device-code login from a single asyncio task.
+
+    `sessions` is the bot's ongoing_auths dict; a session stops being polled
+    as soon as it is removed from (or replaced in) that dict. Each session is
+    polled every `interval` seconds at first, backing off by `backoff` per
+    unanswered poll up to `max_interval`, and never past its expires_at.
+    Polls run as their own tasks, at most `max_concurrent` at once, so one
+    slow authorize call never holds up the other sessions. They share the
+    Seedr thread pool with interactive handlers, so keep that cap well below
+    its size.
+    """
+
+    def __init__(self, sessions, on_authorized, on_expired, interval=5, max_interval=30,
+                 backoff=1.5, max_concurrent=4):
+        self.sessions = sessions
+        self.on_authorized = on_authorized  # async (user_id, auth_data)
+        self.on_expired = on_expired  # async (user_id, auth_data, reason)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_concurrent = max_concurrent
+        # Skip sessions that were cancelled, completed or restarted meanwhile
+        self._scheduler = PollScheduler(
+            self._authorize, self._check, lambda user_id, auth_data: self.sessions.get(user_id) is auth_data,
+            max_outstanding=max_concurrent
+        )
+        self.polls = 0
+        self.authorized = 0
+        self.expired = 0
+
+    def add(self, user_id):
+        """Start polling the user's current session (call from within the event loop)"""
+        auth_data = self.sessions[user_id]
+        auth_data['poll_interval'] = self.interval
+        self._schedule(user_id, auth_data, time.time() + self.interval)
+
+    def _schedule(self, user_id, auth_data, poll_at):
+        self._scheduler.schedule(min(poll_at, auth_data['expires_at']), user_id, auth_data)
+
+    async def _authorize(self, user_id, auth_data):
+        if time.time() >= auth_data['expires_at']:
+            return None
+        self.polls += 1
+        try:
+            return await auth_data['login_instance'].authorize(auth_data['device_code'])
+        except Exception:
+            return None  # network trouble: just back off and retry
+
+    async def _check(self, response, user_id, auth_data):
+        if response and 'access_token' in response:
+            if self.sessions.get(user_id) is auth_data:
+                self.authorized += 1
+                await self.on_authorized(user_id, auth_data)
+            return
+
+        if time.time() >= auth_data['expires_at']:
+            await self._finish(user_id, auth_data, 'expired')
+            return
+
+        error = response.get('error') if isinstance(response, dict) else None
+        if response is not None and error not in ('authorization_pending', 'slow_down'):
+            await self._finish(user_id, auth_data, error or 'denied')
+            return
+
+        auth_data['poll_interval'] = min(auth_data['poll_interval'] * self.backoff, self.max_interval)
+        if error == 'slow_down':
+            auth_data['poll_interval'] = self.max_interval
+        self._schedule(user_id, auth_data, time.time() + auth_data['poll_interval'])
+
+    async def _finish(self, user_id, auth_data, reason):
+        if self.sessions.get(user_id) is not auth_data:
+            return
+        del self.sessions[user_id]
+        self.expired += 1
+        await self.on_expired(user_id, auth_data, reason)
+
+    def stats(self):
+        return {
+            'pending': len(self.sessions),
+            'scheduled': len(self._scheduler),
+            'polls': self.polls,
+            'authorized': self.authorized,
+            'expired': self.expired,
+        }
@@ -0,0 +1,82 @@
+"""Per-callback dispatch cost: CallbackRouter vs. one regex handler per button type.
+
+Usage: python benchmarks/bench_callbacks.py [iterations]
+"""
+import asyncio
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from callbacks import CallbackRouter  # noqa: E402
+
+# The handler patterns main.py registered before the router, in registration order
+REGEX_HANDLERS = [
+    b'start_auth', b'check_auth', b'cancel_auth', b'unlink_account', b'list_folders',
+    b'check_storage', b'folder_(.*)', b'file_(.*)_(.*)', b'download_folder_(.*)',
+    b'delete_file_(.*)', b'refresh_folders', b'refresh_files_(.*)',
+]
+
+LEGACY_PRESSES = [
+    b'list_folders', b'folder_123456', b'file_987654321_123456',
+    b'download_folder_123456', b'delete_file_987654321', b'refresh_files_123456',
+]
+
+
+class Event:
+    def __init__(self, data):
+        self.data = data
+
+
+async def noop(event, *args):
+    pass
+
+
+async def bench_regex(presses, iterations):
+    # Telethon checks every registered CallbackQuery handler against each update
+    handlers = [(re.compile(pattern).match, noop) for pattern in REGEX_HANDLERS]
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for data in presses:
+            event = Event(data)
+            for match, handler in handlers:
+                found = match(data)
+                if found:
+                    await handler(event, *found.groups())
+    return (time.perf_counter() - started) / (iterations * len(presses))
+
+
+async def bench_router(router, presses, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for data in presses:
+            await router.dispatch(Event(data))
+    return (time.perf_counter() - started) / (iterations * len(presses))
+
+
+async def main(iterations):
+    router = CallbackRouter()
+    for opcode in 'ACXUMLRSFYIZK':
+        router.route(opcode)(noop)
+
+    compact = [
+        router.encode('L'), router.encode('F', 123456), router.encode('I', 987654321, 123456),
+        router.encode('Z', 123456), router.encode('K', 987654321), router.encode('Y', 123456),
+    ]
+    oversized = [router.encode('I', 'x' * 80, 123456)]
+
+    results = [
+        ('regex handlers', await bench_regex(LEGACY_PRESSES, iterations)),
+        ('router (compact)', await bench_router(router, compact, iterations)),
+        ('router (short id)', await bench_router(router, oversized, iterations)),
+    ]
+    print(f"{'dispatch':<20} {'ns/callback':>12}")
+    for name, seconds in results:
+        print(f"{name:<20} {seconds * 1e9:>12,.0f}")
+    print(f"\nlongest compact payload: {max(len(data) for data in compact)} bytes")
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000))
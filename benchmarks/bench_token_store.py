@@ -0,0 +1,59 @@
+"""Compare get/save throughput of the JSON and SQLite token stores.
+
+Usage: python benchmarks/bench_token_store.py [user counts...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_store import JsonTokenStore, SqliteTokenStore  # noqa: E402
+
+LOOKUPS = 20000
+SAVES = 2000
+
+
+def make_entries(count):
+    now = int(time.time())
+    # Roughly the size of a Fernet-encrypted Seedr token
+    return {str(user_id): {'token': 'x' * 240, 'last_updated': now} for user_id in range(count)}
+
+
+def bench(store, users):
+    ids = [str(random.randrange(users)) for _ in range(LOOKUPS)]
+    started = time.perf_counter()
+    for user_id in ids:
+        store.get(user_id)
+    get_rate = LOOKUPS / (time.perf_counter() - started)
+
+    now = int(time.time())
+    started = time.perf_counter()
+    for i in range(SAVES):
+        store.put(str(random.randrange(users)), {'token': 'y' * 240, 'last_updated': now + i})
+    store.flush()  # include the cost of getting the saves onto disk
+    save_rate = SAVES / (time.perf_counter() - started)
+    return get_rate, save_rate
+
+
+def main(counts):
+    print(f"{'backend':<8} {'users':>8} {'get/s':>12} {'save/s':>12}")
+    for users in counts:
+        entries = make_entries(users)
+        with tempfile.TemporaryDirectory() as tmp:
+            backends = [
+                ('json', JsonTokenStore(os.path.join(tmp, 'user_tokens.json'), flush_interval=0.05)),
+                ('sqlite', SqliteTokenStore(os.path.join(tmp, 'user_tokens.db'))),
+            ]
+            for name, store in backends:
+                store.put_many(entries)
+                store.flush()
+                get_rate, save_rate = bench(store, users)
+                store.close()
+                print(f"{name:<8} {users:>8} {get_rate:>12,.0f} {save_rate:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
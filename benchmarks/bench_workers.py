@@ -0,0 +1,129 @@
+"""Throughput of the multi-process bot (workers.py) for different worker counts.
+
+Runs the real dispatcher and worker processes; every worker imports main.py
+with the load test's fake Seedr patched in, and all of them share one SQLite
+token store. Simulated users open /folders, then click through folders and
+files. Give the fake Seedr some CPU work per call (--seedr-cpu) to see what
+a single process' GIL costs.
+
+Usage: python benchmarks/bench_workers.py [--workers 1,2,4] [--users 64] [--interactions 20] [--seedr-cpu 0.01]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+
+from fakes import FakeTelegram  # noqa: E402
+from loadtest import load_bot, percentile  # noqa: E402
+from send_queue import Outbox  # noqa: E402
+from token_store import SqliteTokenStore  # noqa: E402
+from workers import Dispatcher  # noqa: E402
+
+OP_FOLDER = 'F'  # same opcodes as main.py
+OP_FILE = 'I'
+
+
+def load_fake_bot():
+    """Worker setup hook: main.py with the fake Seedr, configured by the parent benchmark"""
+    args = argparse.Namespace(**json.loads(os.environ['BENCH_WORKERS_ARGS']))
+    bot, service, telegram = load_bot(args, os.environ['BENCH_WORKERS_DIR'])
+    return bot
+
+
+async def drive(dispatcher, telegram, user_id, rng, interactions, latencies):
+    async def command(text):
+        await dispatcher.dispatch(telegram.new_message(user_id, text))
+        return telegram.last.get(user_id)
+
+    async def press(message, opcodes):
+        choices = [data for data in message.callback_data() if data[:1] in opcodes] if message else []
+        if not choices:
+            return None
+        await dispatcher.dispatch(telegram.callback_query(user_id, message, rng.choice(choices)))
+        return telegram.last.get(user_id)
+
+    await command('/start')
+    folders = None
+    for _ in range(interactions):
+        started = time.perf_counter()
+        if folders is None or rng.random() < 0.2:
+            folders = current = await command('/folders')
+        else:
+            current = await press(current, (OP_FOLDER.encode(), OP_FILE.encode())) or folders
+        latencies.append(time.perf_counter() - started)
+
+
+async def measure(args, workers):
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    client = SimpleNamespace()
+    telegram.install(client)
+    outbox = Outbox(global_rate=1000000, chat_rate=1000000)
+    dispatcher = Dispatcher(client, outbox, workers, setup='bench_workers:load_fake_bot')
+    await dispatcher.start()
+    rng = random.Random(args.seed)
+    latencies = []
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            drive(dispatcher, telegram, 100000 + i, random.Random(rng.random()), args.interactions, latencies)
+            for i in range(args.users)
+        ])
+        elapsed = time.perf_counter() - started
+    finally:
+        await dispatcher.stop()
+    return latencies, elapsed, dispatcher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', default='1,2,4', help="comma separated worker counts to compare")
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--interactions', type=int, default=20, help="interactions per user")
+    parser.add_argument('--seedr-latency', type=float, default=0.05, help="seconds per fake Seedr call")
+    parser.add_argument('--seedr-cpu', type=float, default=0.01, help="seconds of CPU work per fake Seedr call")
+    parser.add_argument('--depth', type=int, default=2, help="folder tree depth")
+    parser.add_argument('--fanout', type=int, default=5, help="subfolders per folder")
+    parser.add_argument('--files', type=int, default=10, help="files per folder")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="seconds per fake Telegram request")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    bot_args = {
+        'seedr_latency': args.seedr_latency, 'seedr_cpu': args.seedr_cpu, 'seedr_errors': 0.0,
+        'depth': args.depth, 'fanout': args.fanout, 'files': args.files,
+        'telegram_latency': 0.0, 'telegram_rate': False, 'seed': args.seed,
+    }
+    print(f"{args.users} users x {args.interactions} interactions, Seedr latency {args.seedr_latency * 1000:.0f} ms "
+          f"+ {args.seedr_cpu * 1000:.0f} ms CPU per call")
+    print(f"{'workers':>8}{'interactions/s':>16}{'p50 ms':>10}{'p99 ms':>10}{'speedup':>9}  updates per worker")
+    # Workers import this module for load_fake_bot
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [BENCHMARKS, os.environ.get('PYTHONPATH')]))
+    baseline = None
+    for workers in [int(n) for n in args.workers.split(',')]:
+        with tempfile.TemporaryDirectory() as workdir:
+            store = SqliteTokenStore(os.path.join(workdir, 'tokens.db'))
+            store.put_many({100000 + i: {'token': f"token-{100000 + i}", 'last_updated': int(time.time())}
+                            for i in range(args.users)})
+            store.close()
+            os.environ['BENCH_WORKERS_ARGS'] = json.dumps(bot_args)
+            os.environ['BENCH_WORKERS_DIR'] = workdir
+            latencies, elapsed, stats = asyncio.run(measure(args, workers))
+
+        throughput = len(latencies) / elapsed
+        baseline = baseline or throughput
+        print(f"{workers:>8}{throughput:>16,.1f}{percentile(latencies, 0.5) * 1000:>10.1f}"
+              f"{percentile(latencies, 0.99) * 1000:>10.1f}{throughput / baseline:>8.2f}x  "
+              f"{sorted(stats['dispatched'].values())}")
+
+
+if __name__ == '__main__':
+    main()
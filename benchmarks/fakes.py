@@ -0,0 +1,244 @@
+"""In-process stand-ins for Seedr and Telegram used by the load test.
+
+FakeSeedrService serves one synthetic folder tree to every account with a
+configurable latency and error rate, and counts every call it receives.
+FakeTelegram records what the bot sends and builds the NewMessage and
+CallbackQuery events the real handlers in main.py expect.
+"""
+import asyncio
+import copy
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+
+
+class FakeSeedrService:
+    def __init__(self, latency=0.05, error_rate=0.0, depth=2, fanout=5, files=10, revoked=(), seed=0, cpu=0.0):
+        self.latency = latency
+        self.cpu = cpu  # seconds of GIL-holding work per call, like parsing a large response
+        self.error_rate = error_rate
+        self.revoked = set(revoked)  # tokens testToken rejects
+        self.calls = Counter()
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1000)
+        self.folders = {}  # folder id -> listing
+        self.file_count = 0
+        self._build('0', 'root', depth, fanout, files)
+
+    def _build(self, folder_id, name, depth, fanout, files):
+        listing = {'id': folder_id, 'name': name, 'folders': [], 'files': [], 'torrents': []}
+        self.folders[folder_id] = listing
+        for _ in range(files if folder_id != '0' else 2):
+            file_id = next(self._ids)
+            listing['files'].append({
+                'id': file_id, 'folder_file_id': file_id,
+                'name': f"{name}-file-{file_id}.mkv", 'size': self._rng.randint(1, 4096) * 1024 ** 2,
+            })
+            self.file_count += 1
+        if depth:
+            for _ in range(fanout):
+                child = str(next(self._ids))
+                child_listing = self._build(child, f"{name}-{child}", depth - 1, fanout, files)
+                listing['folders'].append({
+                    'id': int(child), 'name': child_listing['name'],
+                    'size': sum(f['size'] for f in child_listing['files']), 'last_update': '2024-01-01 00:00:00',
+                })
+        return listing
+
+    def call(self, method):
+        """Account for one call: sleep like the network would and maybe fail"""
+        with self._lock:
+            self.calls[method] += 1
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            delay = self.latency * self._rng.uniform(0.5, 1.5)
+        time.sleep(delay)  # seedrcc is blocking, so this runs on the bot's Seedr pool
+        deadline = time.perf_counter() + self.cpu
+        while time.perf_counter() < deadline:
+            pass
+        if fail:
+            raise ConnectionError(f"fake Seedr error in {method}")
+
+    def seedr_class(self):
+        """A drop-in for seedrcc.Seedr bound to this service"""
+        service = self
+
+        class Seedr:
+            def __init__(self, token=None, **kwargs):
+                self.token = token
+
+            def testToken(self):
+                service.call('testToken')
+                if self.token in service.revoked:
+                    return {'error': 'invalid_token', 'status_code': 401}
+                return {'result': True}
+
+            def getMemoryBandwidth(self):
+                service.call('getMemoryBandwidth')
+                return {'space_max': 50 * 1024 ** 3, 'space_used': 12 * 1024 ** 3, 'bandwidth_used': 3 * 1024 ** 3}
+
+            def listContents(self, folderId=0, contentType='folder'):
+                service.call('listContents')
+                listing = service.folders.get(str(folderId))
+                if listing is None:
+                    return {'error': 'not_found'}
+                return copy.deepcopy(listing)
+
+            def fetchFile(self, fileId):
+                service.call('fetchFile')
+                return {'url': f"https://fake.seedr.cc/dl/{fileId}", 'name': f"file-{fileId}"}
+
+            def createArchive(self, folderId):
+                service.call('createArchive')
+                return {'archive_url': f"https://fake.seedr.cc/zip/{folderId}"}
+
+            def addTorrent(self, magnetLink=None, torrentFile=None, folderId=-1):
+                service.call('addTorrent')
+                torrent_id = next(service._ids)
+                return {'result': True, 'user_torrent_id': torrent_id, 'title': f"torrent-{torrent_id}"}
+
+            def deleteFile(self, fileId):
+                service.call('deleteFile')
+                return {'result': True}
+
+            def deleteFolder(self, folderId):
+                service.call('deleteFolder')
+                return {'result': True}
+
+        return Seedr
+
+    def login_class(self):
+        """A drop-in for seedrcc.Login that authorizes on the first poll"""
+        service = self
+
+        class Login:
+            def __init__(self, *args, **kwargs):
+                self.token = None
+
+            def getDeviceCode(self):
+                service.call('getDeviceCode')
+                return {'device_code': 'fake-device', 'user_code': 'FAKE-CODE'}
+
+            def authorize(self, deviceCode):
+                service.call('authorize')
+                self.token = f"token-{next(service._ids)}"
+                return {'access_token': self.token}
+
+        return Login
+
+
+class FakeMessage:
+    def __init__(self, chat_id, message_id, text, buttons):
+        self.chat_id = chat_id
+        self.id = message_id
+        self.text = text
+        self.buttons = buttons
+
+    def callback_data(self):
+        """Callback payloads of the message's inline buttons, in order"""
+        return [data for data in (getattr(button, 'data', None) for button in self.buttons) if data]
+
+
+def _flatten(buttons):
+    if buttons is None:
+        return []
+    if not isinstance(buttons, list):
+        return [buttons]
+    flat = []
+    for row in buttons:
+        flat.extend(row if isinstance(row, list) else [row])
+    return flat
+
+
+class FakeTelegram:
+    """Records the bot's messages per chat and answers requests after `latency` seconds"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = {}  # (chat_id, message_id) -> FakeMessage
+        self.last = {}  # chat_id -> most recently sent or edited FakeMessage
+        self.requests = Counter()
+        self._ids = itertools.count(1)
+
+    async def _request(self, kind):
+        self.requests[kind] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, chat_id, text='', buttons=None, **kwargs):
+        await self._request('send')
+        message = FakeMessage(chat_id, next(self._ids), text, _flatten(buttons))
+        self.messages[(chat_id, message.id)] = message
+        self.last[chat_id] = message
+        return message
+
+    async def edit(self, chat_id, message_id, text='', buttons=None, **kwargs):
+        await self._request('edit')
+        message = self.messages.get((chat_id, message_id))
+        if message is None:
+            message = self.messages[(chat_id, message_id)] = FakeMessage(chat_id, message_id, text, [])
+        message.text = text
+        message.buttons = _flatten(buttons)
+        self.last[chat_id] = message
+        return message
+
+    async def send_file(self, chat_id, file, caption='', **kwargs):
+        return await self.send(chat_id, caption)
+
+    def install(self, client):
+        """Point the client's outgoing calls used by main.py at this fake"""
+        client.edit_message = self.edit
+        client.send_file = self.send_file
+
+    def new_message(self, user_id, text):
+        return FakeNewMessage(self, user_id, text)
+
+    def callback_query(self, user_id, message, data):
+        return FakeCallbackQuery(self, user_id, message, data)
+
+
+class _Content:
+    def __init__(self, text):
+        self.text = text
+        self.message = text
+        self.file = None
+
+    async def download_media(self, file=None):
+        return None
+
+
+class FakeNewMessage:
+    def __init__(self, telegram, user_id, text):
+        self.telegram = telegram
+        self.sender_id = user_id
+        self.chat_id = user_id
+        self.message = _Content(text)
+        self.raw_text = text
+
+    async def respond(self, *args, **kwargs):
+        return await self.telegram.send(self.chat_id, *args, **kwargs)
+
+
+class FakeCallbackQuery:
+    def __init__(self, telegram, user_id, message, data):
+        self.telegram = telegram
+        self.sender_id = user_id
+        self.chat_id = message.chat_id
+        self.message_id = message.id
+        self.data = data
+        self.answers = []
+
+    async def respond(self, *args, **kwargs):
+        return await self.telegram.send(self.chat_id, *args, **kwargs)
+
+    async def edit(self, *args, **kwargs):
+        return await self.telegram.edit(self.chat_id, self.message_id, *args, **kwargs)
+
+    async def answer(self, *args, **kwargs):
+        await self.telegram._request('answer')
+        self.answers.append(args)
@@ -0,0 +1,181 @@
+"""Drive the real handlers in main.py with simulated users against fake Seedr and Telegram.
+
+Every simulated user clicks through folders and files, checks storage, adds
+magnets and searches, always pressing buttons the bot actually sent it.
+Reports interactions/sec, p50/p99 latency per action and Seedr calls per
+interaction, so optimizations can be compared against a baseline run.
+
+Usage: python benchmarks/loadtest.py [--users 50] [--interactions 20] [--seedr-latency 0.05] ...
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeSeedrService, FakeTelegram  # noqa: E402
+
+ACTIONS = ('folders', 'open_folder', 'open_file', 'storage', 'magnet', 'find')
+WEIGHTS = (3, 4, 3, 2, 1, 1)
+
+
+def load_bot(args, workdir):
+    """Import main.py with a throwaway configuration and the fakes patched in"""
+    os.environ.setdefault('TELEGRAM_API_ID', '1')
+    os.environ.setdefault('TELEGRAM_API_HASH', 'loadtest')
+    os.environ['TOKEN_STORE'] = os.path.join(workdir, 'tokens.db')
+    if not args.telegram_rate:
+        # Measure the bot itself, not Telegram's flood limits
+        os.environ['SEND_GLOBAL_RATE'] = '1000000'
+        os.environ['SEND_CHAT_RATE'] = '1000000'
+    os.chdir(workdir)  # the Telethon session file lands here
+
+    import main
+    import session_cache
+
+    service = FakeSeedrService(latency=args.seedr_latency, error_rate=args.seedr_errors,
+                               depth=args.depth, fanout=args.fanout, files=args.files, seed=args.seed,
+                               cpu=args.seedr_cpu)
+    session_cache.Seedr = service.seedr_class()
+    main.Login = service.login_class()
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    telegram.install(main.client)
+    return main, service, telegram
+
+
+class SimulatedUser:
+    def __init__(self, bot, telegram, user_id, rng):
+        self.bot = bot
+        self.telegram = telegram
+        self.user_id = user_id
+        self.rng = rng
+        self.folder_list = None  # last message showing the folder list
+        self.folder = None  # last message showing a folder's contents
+
+    async def command(self, handler, text):
+        await handler(self.telegram.new_message(self.user_id, text))
+        return self.telegram.last.get(self.user_id)
+
+    async def press(self, message, opcode):
+        """Press a random button of `message` with the given opcode; False if there is none"""
+        choices = [data for data in message.callback_data() if data[:1] == opcode.encode()] if message else []
+        if not choices:
+            return False
+        data = self.rng.choice(choices)
+        await self.bot.callback_dispatcher(self.telegram.callback_query(self.user_id, message, data))
+        return True
+
+    async def act(self, action):
+        """Perform one interaction and return the action actually performed"""
+        bot = self.bot
+        if action == 'open_file' and self.folder is None:
+            action = 'open_folder'
+        if action == 'open_folder' and self.folder_list is None:
+            action = 'folders'
+
+        if action == 'folders':
+            self.folder_list = await self.command(bot.list_folders_handler, '/folders')
+        elif action == 'open_folder':
+            if await self.press(self.folder_list, bot.OP_FOLDER):
+                self.folder = self.telegram.last.get(self.user_id)
+        elif action == 'open_file':
+            if not await self.press(self.folder, bot.OP_FILE):
+                await self.press(self.folder, bot.OP_FOLDER)
+        elif action == 'storage':
+            message = await self.command(bot.storage_handler, '/storage')
+            await self.press(message, bot.OP_STORAGE)
+        elif action == 'magnet':
+            info_hash = '%040x' % self.rng.getrandbits(160)
+            await self.command(bot.add_magnet_handler, f"/addmagnet magnet:?xt=urn:btih:{info_hash}&dn=loadtest")
+        elif action == 'find':
+            await self.command(bot.find_handler, f"/find file {self.rng.randint(1, 9)}")
+        return action
+
+
+async def run(args, bot, service, telegram):
+    rng = random.Random(args.seed)
+    users = [SimulatedUser(bot, telegram, 100000 + i, random.Random(rng.random())) for i in range(args.users)]
+    for user in users:
+        bot.auth_manager.save_token(user.user_id, f"token-{user.user_id}")
+
+    latencies = defaultdict(list)
+
+    async def drive(user):
+        await user.command(bot.start_handler, '/start')
+        for _ in range(args.interactions):
+            started = time.perf_counter()
+            try:
+                action = await user.act(user.rng.choices(ACTIONS, WEIGHTS)[0])
+            except Exception as e:
+                action = f"error ({type(e).__name__})"
+            latencies[action].append(time.perf_counter() - started)
+
+    calls_before = sum(service.calls.values())
+    started = time.perf_counter()
+    await asyncio.gather(*[drive(user) for user in users])
+    elapsed = time.perf_counter() - started
+    return latencies, elapsed, sum(service.calls.values()) - calls_before
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def report(args, latencies, elapsed, seedr_calls, service, telegram):
+    total = sum(len(values) for values in latencies.values())
+    everything = [v for values in latencies.values() for v in values]
+    print(f"{args.users} users x {args.interactions} interactions, Seedr latency {args.seedr_latency * 1000:.0f} ms, "
+          f"tree of {len(service.folders)} folders / {service.file_count} files")
+    print(f"{total} interactions in {elapsed:.2f}s = {total / elapsed:,.1f} interactions/s")
+    print(f"latency p50 {percentile(everything, 0.5) * 1000:.1f} ms, p99 {percentile(everything, 0.99) * 1000:.1f} ms")
+    print(f"Seedr calls per interaction: {seedr_calls / max(total, 1):.2f} ({seedr_calls} calls, "
+          f"{service.errors} injected errors)")
+    print()
+    print(f"{'action':<16}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for action, values in sorted(latencies.items()):
+        print(f"{action:<16}{len(values):>8}{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.99) * 1000:>10.1f}")
+    print()
+    print("Seedr calls: " + ", ".join(f"{method}={count}" for method, count in service.calls.most_common()))
+    print("Telegram requests: " + ", ".join(f"{kind}={count}" for kind, count in telegram.requests.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--interactions', type=int, default=20, help="interactions per user")
+    parser.add_argument('--seedr-latency', type=float, default=0.05, help="seconds per fake Seedr call")
+    parser.add_argument('--seedr-cpu', type=float, default=0.0, help="seconds of CPU work per fake Seedr call")
+    parser.add_argument('--seedr-errors', type=float, default=0.0, help="fraction of Seedr calls that fail")
+    parser.add_argument('--depth', type=int, default=2, help="folder tree depth")
+    parser.add_argument('--fanout', type=int, default=5, help="subfolders per folder")
+    parser.add_argument('--files', type=int, default=10, help="files per folder")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="seconds per fake Telegram request")
+    parser.add_argument('--telegram-rate', action='store_true', help="keep the outbox's real rate limits")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bot, service, telegram = load_bot(args, workdir)
+        loop = bot.client.loop
+        try:
+            latencies, elapsed, seedr_calls = loop.run_until_complete(run(args, bot, service, telegram))
+        finally:
+            # Stop the bot's background pollers before the loop goes away
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            bot.seedr_executor.shutdown()
+            bot.auth_manager.close()
+        report(args, latencies, elapsed, seedr_calls, service, telegram)
+
+
+if __name__ == '__main__':
+    main()
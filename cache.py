@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire `ttl` seconds after being set.
+
+    With an ExpiryService, expired entries are also removed in the background
+    instead of lingering until they are looked up or pushed out. A key has at
+    most one pending expiry callback: rewriting it with a later deadline
+    leaves the existing callback to re-arm itself when it fires.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60, expiry=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.expiry = expiry
+        self._entries = OrderedDict()
+        self._scheduled = {}  # key -> deadline of its pending expiry callback
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        item = self._entries.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        if self.expiry:
+            self._schedule(key, expires_at)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _schedule(self, key, expires_at):
+        scheduled = self._scheduled.get(key)
+        if scheduled is not None and scheduled <= expires_at:
+            return  # that callback fires first and re-arms for this deadline
+        self._scheduled[key] = expires_at
+        self.expiry.call_later(expires_at - time.monotonic(), self._expire, key, expires_at)
+
+    def _expire(self, key, scheduled):
+        if self._scheduled.get(key) != scheduled:
+            return  # an earlier callback took over this key
+        del self._scheduled[key]
+        item = self._entries.get(key)
+        if item is None:
+            return
+        if time.monotonic() >= item[0]:
+            del self._entries[key]
+        else:
+            self._schedule(key, item[0])
+
+    def pop(self, key, default=None):
+        item = self._entries.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key):
+        item = self._entries.get(key)
+        return item is not None and time.monotonic() < item[0]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
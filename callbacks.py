@@ -0,0 +1,101 @@
+import re
+import secrets
+from state_backend import InProcessBackend
+from metrics import metrics
+
+# Telegram rejects inline buttons whose callback data is longer than this
+MAX_CALLBACK_DATA = 64
+
+# Compact callback data is <opcode byte><arg>:<arg>...; opcodes are uppercase
+# so they never collide with the older lowercase "folder_123"-style payloads
+SEPARATOR = b':'
+SHORT_ID = b'~'
+
+
+class CallbackRouter:
+    """Routes inline button presses to handlers with a single dict lookup.
+
+    Payloads that would not fit in Telegram's 64 bytes are kept server-side
+    and the button only carries a short id that expires after `token_ttl`.
+    With a shared state backend those ids resolve in every worker process.
+    """
+
+    def __init__(self, token_ttl=86400, max_tokens=100000, expiry=None, backend=None):
+        self._routes = {}
+        self._legacy = []
+        backend = backend or InProcessBackend(expiry=expiry)
+        self._tokens = backend.namespace('callback_short_ids', ttl=token_ttl, max_entries=max_tokens)
+        self.expired = 0
+        self.unknown = 0
+
+    def route(self, opcode):
+        """Decorator registering handler(event, *args) for a one-letter opcode"""
+        key = opcode.encode()[0]
+
+        def decorator(handler):
+            self._routes[key] = handler
+            return handler
+
+        return decorator
+
+    def add_legacy(self, pattern, opcode):
+        """Keep buttons sent before the compact format working"""
+        self._legacy.append((re.compile(pattern), opcode.encode()[0]))
+
+    def encode(self, opcode, *args):
+        """Build callback data for an opcode and its arguments"""
+        parts = [str(arg).encode() for arg in args]
+        data = opcode.encode() + SEPARATOR.join(parts)
+        if len(data) <= MAX_CALLBACK_DATA and not any(SEPARATOR in part for part in parts):
+            return data
+        token = secrets.token_urlsafe(6).encode()
+        self._tokens.set(token, (opcode.encode()[0], tuple(str(arg) for arg in args)))
+        return SHORT_ID + token
+
+    def decode(self, data):
+        """Return (opcode, args) for callback data, or (None, ()) if it is unknown or expired"""
+        if not data:
+            return None, ()
+        head = data[0]
+        if data[:1] == SHORT_ID:
+            item = self._tokens.get(data[1:])
+            if item is None:
+                self.expired += 1
+                return None, ()
+            return item
+        if head in self._routes:
+            body = data[1:]
+            return head, tuple(part.decode() for part in body.split(SEPARATOR)) if body else ()
+        for pattern, opcode in self._legacy:
+            match = pattern.fullmatch(data)
+            if match:
+                return opcode, tuple(group.decode() for group in match.groups())
+        return None, ()
+
+    async def dispatch(self, event):
+        """Run the handler for a button press; returns False if nothing handled it"""
+        opcode, args = self.decode(event.data)
+        handler = self._routes.get(opcode)
+        if handler is None:
+            self.unknown += 1
+            return False
+        started = metrics.begin('callback', handler.__name__)
+        error = True
+        try:
+            await handler(event, *args)
+            error = False
+        finally:
+            metrics.end('callback', handler.__name__, started, error)
+        return True
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+    def stats(self):
+        return {
+            'routes': len(self._routes),
+            'short_ids': len(self._tokens),
+            'expired': self.expired,
+            'unknown': self.unknown,
+        }
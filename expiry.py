@@ -0,0 +1,86 @@
+import asyncio
+import math
+import time
+import traceback
+
+
+class ExpiryService:
+    """Hashed timer wheel shared by everything in the bot that holds TTL state.
+
+    call_later() drops a callback into the slot its deadline falls in, and
+    every `tick` seconds the service runs the callbacks of one slot. Only
+    deadlines within the current turn of the wheel sit in the slots, so every
+    entry a tick visits is due. Later deadlines wait in a bucket per turn and
+    are moved into their slots once, when that turn starts. Scheduling and
+    expiring an entry are O(1), plus one move for long deadlines.
+
+    Callbacks must re-check that the entry they were scheduled for is still
+    the live one, since entries can be replaced or refreshed meanwhile.
+    """
+
+    def __init__(self, tick=1.0, slots=512):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._later = {}  # turn -> [(target tick, callback, args)] for deadlines past the current turn
+        self._now_tick = 0
+        self._origin = time.monotonic()
+        self._gauges = {}
+        self._task = None
+        self.pending = 0
+        self.fired = 0
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) roughly `delay` seconds from now (rounded up to a tick)"""
+        target = self._current_tick() + max(1, math.ceil(delay / self.tick))
+        turn = target // len(self._slots)
+        if turn == self._now_tick // len(self._slots):
+            self._slots[target % len(self._slots)].append((target, callback, args))
+        else:
+            self._later.setdefault(turn, []).append((target, callback, args))
+        self.pending += 1
+
+    def track(self, name, container):
+        """Report len(container) as a gauge named `name`"""
+        self._gauges[name] = container
+
+    def gauges(self):
+        """Live entry counts of every tracked container"""
+        values = {name: len(container) for name, container in self._gauges.items()}
+        values['expiry_pending'] = self.pending
+        return values
+
+    def _current_tick(self):
+        return int((time.monotonic() - self._origin) / self.tick)
+
+    def advance(self):
+        """Process every tick that has elapsed since the last call"""
+        until = self._current_tick()
+        slots = len(self._slots)
+        while self._now_tick < until:
+            self._now_tick += 1
+            index = self._now_tick % slots
+            if not index:
+                # A new turn: its deadlines move into their slots
+                for entry in self._later.pop(self._now_tick // slots, ()):
+                    self._slots[entry[0] % slots].append(entry)
+            due = self._slots[index]
+            if not due:
+                continue
+            self._slots[index] = []
+            self.pending -= len(due)
+            for _, callback, args in due:
+                self.fired += 1
+                try:
+                    callback(*args)
+                except Exception:
+                    traceback.print_exc()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance()
+
+    def start(self, loop=None):
+        if self._task is None or self._task.done():
+            self._task = (loop or asyncio.get_event_loop()).create_task(self.run())
+        return self._task
@@ -0,0 +1,199 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class FileEntry:
+    __slots__ = ('file_id', 'folder_id', 'name', 'path', 'size', 'text')
+
+    def __init__(self, file_id, folder_id, name, path, size):
+        self.file_id = file_id
+        self.folder_id = folder_id
+        self.name = name
+        self.path = path
+        self.size = size
+        self.text = path.lower()
+
+
+class FolderNode:
+    __slots__ = ('signature', 'path', 'children', 'files')
+
+    def __init__(self, signature, path):
+        self.signature = signature
+        self.path = path
+        self.children = []
+        self.files = []
+
+
+def _signature(folder):
+    # Seedr bumps a folder's size and last_update whenever anything below it changes
+    return folder.get('size'), folder.get('last_update')
+
+
+class UserIndex:
+    """One user's Seedr tree with a trigram inverted index over file paths"""
+
+    def __init__(self):
+        self.folders = {}  # folder_id -> FolderNode
+        self.files = {}  # file_id -> FileEntry
+        self.grams = {}  # trigram -> set of file ids
+        self.built_at = 0.0
+        self.stale = True
+
+    def _add_file(self, entry):
+        self.files[entry.file_id] = entry
+        for gram in trigrams(entry.text):
+            self.grams.setdefault(gram, set()).add(entry.file_id)
+
+    def _keep_subtree(self, old, folder_id):
+        """Carry an unchanged folder and everything below it over from the previous index"""
+        node = self.folders[folder_id] = old.folders[folder_id]
+        for file_id in node.files:
+            self._add_file(old.files[file_id])
+        for child in node.children:
+            if child in old.folders:
+                self._keep_subtree(old, child)
+
+    async def refresh(self, list_folder, concurrency=4):
+        """Build an up to date copy of this index, re-listing only folders whose signature changed.
+
+        The crawl fills a new index and leaves this one untouched, so a
+        failed listing never leaves half an update (or a folder marked as
+        current whose subtree was not re-listed) behind. Returns
+        (new index, number of listings it needed).
+        """
+        index = UserIndex()
+        limit = asyncio.Semaphore(concurrency)
+        listings = 0
+
+        async def visit(folder_id, signature, path):
+            nonlocal listings
+            async with limit:
+                contents = await list_folder(folder_id)
+            listings += 1
+            if not isinstance(contents, dict) or 'error' in contents:
+                raise RuntimeError(f"Couldn't list folder {folder_id}")
+
+            node = index.folders[folder_id] = FolderNode(signature, path)
+            for file in contents.get('files', []):
+                file_id = str(file.get('id') or file.get('file_id') or file.get('folder_file_id'))
+                name = file.get('name', 'file')
+                index._add_file(FileEntry(file_id, folder_id, name, path + name, int(file.get('size', 0) or 0)))
+                node.files.append(file_id)
+
+            pending = []
+            for folder in contents.get('folders', []):
+                child = str(folder.get('id'))
+                node.children.append(child)
+                child_path = path + folder.get('name', 'folder') + '/'
+                old = self.folders.get(child)
+                if old is not None and old.signature == _signature(folder) and old.path == child_path:
+                    index._keep_subtree(self, child)  # unchanged: keep what we have
+                else:
+                    pending.append(asyncio.ensure_future(visit(child, _signature(folder), child_path)))
+            try:
+                await asyncio.gather(*pending)
+            except BaseException:
+                # Don't leave sibling crawls running once this one has failed
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                raise
+
+        await visit('0', None, '')
+        index.built_at = time.monotonic()
+        index.stale = False
+        return index, listings
+
+    def search(self, query):
+        """Files whose path contains every word of the query, best matches first"""
+        words = query.lower().split()
+        if not words:
+            return []
+        candidates = None
+        for word in words:
+            for gram in trigrams(word):
+                ids = self.grams.get(gram, ())
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+        entries = self.files.values() if candidates is None else (self.files[i] for i in candidates)
+        matches = [entry for entry in entries if all(word in entry.text for word in words)]
+        # Hits in the file name beat hits in folder names, then shorter paths first
+        matches.sort(key=lambda e: (not all(word in e.name.lower() for word in words), len(e.path), e.path))
+        return matches
+
+
+class FileIndex:
+    """Per-user file indexes, crawled on demand and refreshed incrementally.
+
+    An index is reused for `ttl` seconds unless the account changed, and at
+    most one crawl per user runs at a time. Indexes of the least recently
+    searched users are dropped beyond `max_users`.
+    """
+
+    def __init__(self, list_folder, ttl=300, concurrency=4, max_users=1000):
+        self.list_folder = list_folder  # async (user_id, account, folder_id) -> listing
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._crawls = {}
+        self.crawls = 0
+        self.listings = 0
+        self.last_crawl_time = 0.0
+
+    def is_fresh(self, user_id):
+        index = self._users.get(user_id)
+        return index is not None and not index.stale and time.monotonic() - index.built_at < self.ttl
+
+    async def ensure(self, user_id, account):
+        """Return the user's index, crawling first if it is missing or out of date"""
+        if self.is_fresh(user_id):
+            self._users.move_to_end(user_id)
+            return self._users[user_id]
+        crawl = self._crawls.get(user_id)
+        if crawl is None:
+            crawl = self._crawls[user_id] = asyncio.ensure_future(self._crawl(user_id, account))
+            crawl.add_done_callback(lambda _: self._crawls.pop(user_id, None))
+        return await asyncio.shield(crawl)
+
+    async def _crawl(self, user_id, account):
+        previous = self._users.get(user_id) or UserIndex()
+        started = time.monotonic()
+        index, listings = await previous.refresh(
+            lambda folder_id: self.list_folder(user_id, account, folder_id), self.concurrency
+        )
+        self.listings += listings
+        self.crawls += 1
+        self.last_crawl_time = time.monotonic() - started
+        self._users[user_id] = index
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return index
+
+    def mark_stale(self, user_id):
+        """Re-check the user's tree on the next search (their account changed)"""
+        index = self._users.get(user_id)
+        if index is not None:
+            index.stale = True
+
+    def drop(self, user_id):
+        self._users.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._users)
+
+    def stats(self):
+        return {
+            'users': len(self._users),
+            'files': sum(len(index.files) for index in self._users.values()),
+            'crawls': self.crawls,
+            'listings': self.listings,
+            'last_crawl_time': self.last_crawl_time,
+        }
@@ -0,0 +1,129 @@
+import json
+import time
+from collections import OrderedDict
+
+
+# Seedr is inconsistent about which field holds a file's id
+FILE_ID_FIELDS = ('id', 'file_id', 'folder_file_id')
+
+
+def build_file_index(contents):
+    """Map every id alias of every file in a listing to the file's metadata"""
+    index = {}
+    for file in contents.get('files', []):
+        for field in FILE_ID_FIELDS:
+            value = file.get(field)
+            if value is not None:
+                index.setdefault(str(value), file)
+    return index
+
+
+class FolderCache:
+    """Per-user, per-folder cache of listContents responses.
+
+    Entries expire after `ttl` seconds and the cache as a whole is capped by
+    entry count and by the (approximate) serialized size of the listings.
+    Any mutating call on an account drops every listing of that user.
+    """
+
+    def __init__(self, ttl=60, max_entries=5000, max_bytes=64 * 1024 * 1024, expiry=None):
+        self.ttl = ttl
+        self.expiry = expiry
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (user_id, folder_id) -> (expires_at, size, contents, file index)
+        self._user_keys = {}  # user_id -> set of keys, for per-user invalidation
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def list_contents(self, user_id, account, folder_id=0, refresh=False):
+        """Return the folder listing, calling Seedr only on a miss or an explicit refresh"""
+        key = (user_id, str(folder_id))
+        if not refresh:
+            contents = self.get(key)
+            if contents is not None:
+                return contents
+
+        contents = await account.listContents(folderId=folder_id)
+        if isinstance(contents, dict) and 'error' not in contents:
+            self.set(key, contents)
+        return contents
+
+    async def find_file(self, user_id, account, folder_id, file_id):
+        """Look a file up by any of its ids, listing the folder again only on a cache miss"""
+        key = (user_id, str(folder_id))
+        item = self._get_item(key)
+        if item is None or str(file_id) not in item[3]:
+            # Not cached, or the file appeared after the cached listing was taken
+            await self.list_contents(user_id, account, folder_id, refresh=True)
+            item = self._entries.get(key)
+            if item is None:
+                return None
+        return item[3].get(str(file_id))
+
+    def _get_item(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        if time.monotonic() >= item[0]:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def get(self, key):
+        item = self._get_item(key)
+        return item[2] if item else None
+
+    def set(self, key, contents):
+        self._remove(key)
+        size = len(json.dumps(contents, separators=(',', ':')))
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl
+        self._entries[key] = (expires_at, size, contents, build_file_index(contents))
+        if self.expiry:
+            self.expiry.call_later(self.ttl, self._expire, key, expires_at)
+        self._user_keys.setdefault(key[0], set()).add(key)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _expire(self, key, expires_at):
+        item = self._entries.get(key)
+        if item is not None and item[0] == expires_at:
+            self._remove(key)
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is None:
+            return
+        self.bytes -= item[1]
+        keys = self._user_keys.get(key[0])
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def invalidate_user(self, user_id):
+        """Drop every cached listing of a user (after delete / addTorrent / unlink)"""
+        for key in list(self._user_keys.get(user_id, ())):
+            self._remove(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
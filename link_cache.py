@@ -0,0 +1,59 @@
+import secrets
+import time
+from state_backend import InProcessBackend
+
+
+class LinkCache:
+    """Per-user cache of fetchFile responses, keyed by file id.
+
+    Seedr's links stay valid for `link_lifetime` seconds; entries are dropped
+    `margin` seconds before that so a cached link is never handed out just as
+    it dies. Keys carry a random per-user generation kept in the same backend
+    as the links; dropping all of a user's links replaces the generation
+    instead of walking the cache, and the old entries simply age out. A user
+    without a stored generation gets a fresh one, so a lost or evicted
+    generation can only cause misses, never revive old links.
+    """
+
+    def __init__(self, link_lifetime=86400, margin=3600, max_entries=50000, expiry=None, backend=None):
+        self.link_lifetime = link_lifetime
+        backend = backend or InProcessBackend(expiry=expiry)
+        self._links = backend.namespace('download_links', ttl=link_lifetime - margin, max_entries=max_entries)
+        self._generations = backend.namespace('download_link_generations', ttl=link_lifetime - margin,
+                                              max_entries=max_entries)
+
+    def _generation(self, user_id, renew=False):
+        generation = self._generations.get(user_id)
+        if generation is None:
+            generation = secrets.token_hex(4)
+            renew = True
+        if renew:
+            # Outlive every link stored under this generation
+            self._generations.set(user_id, generation)
+        return generation
+
+    def _key(self, user_id, file_id, renew=False):
+        return user_id, self._generation(user_id, renew), str(file_id)
+
+    def get(self, user_id, file_id):
+        """Return (response, expires_at) for a still-usable link, or None"""
+        return self._links.get(self._key(user_id, file_id))
+
+    def set(self, user_id, file_id, response):
+        expires_at = time.time() + self.link_lifetime
+        self._links.set(self._key(user_id, file_id, renew=True), (response, expires_at))
+        return response, expires_at
+
+    def discard(self, user_id, file_id):
+        """Forget the link of a deleted file"""
+        self._links.pop(self._key(user_id, file_id))
+
+    def invalidate_user(self, user_id):
+        """Forget every link of a user (a folder was deleted or the account unlinked)"""
+        self._generations.set(user_id, secrets.token_hex(4))
+
+    def __len__(self):
+        return len(self._links)
+
+    def stats(self):
+        return self._links.stats()
@@ -0,0 +1,87 @@
+import asyncio
+
+
+def _clean(name):
+    """Make a Seedr name safe to use as one path component in a manifest"""
+    name = ' '.join(str(name).split())  # no newlines or tabs inside aria2 option lines
+    name = name.replace('/', '_').replace('\\', '_')
+    return name if name not in ('', '.', '..') else '_'
+
+
+class LinkExport:
+    def __init__(self, name):
+        self.name = name
+        self.entries = []  # (path, size, url)
+        self.failed = []  # (path, error); a path ending in / is a folder that couldn't be listed
+
+    @property
+    def total_size(self):
+        return sum(size for _, size, _ in self.entries)
+
+    def aria2_manifest(self):
+        """The links in aria2c --input-file format, one file per entry"""
+        lines = [f"# {self.name}: {len(self.entries)} files, {self.total_size} bytes"]
+        for path, size, url in self.entries:
+            lines += [f"# {size} bytes", url, f"  out={path}"]
+        for path, error in self.failed:
+            lines.append(f"# FAILED {path}: {error}")
+        return '\n'.join(lines) + '\n'
+
+
+async def export_folder_links(list_folder, account, folder_id, concurrency=4):
+    """Walk a folder tree and generate a fetchFile link for every file in it.
+
+    `list_folder(folder_id)` returns a listContents response (usually through
+    the folder cache). Listings and fetchFile calls share one concurrency cap.
+    A subfolder that can't be listed is reported in `failed` with its path.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    files = []  # (path, file)
+    unlisted = []  # (folder path, error)
+
+    async def listing(fid):
+        async with limit:
+            return await list_folder(fid)
+
+    async def collect(contents, prefix):
+        for file in contents.get('files', []):
+            files.append((prefix + _clean(file.get('name', 'file')), file))
+        await asyncio.gather(*[walk(sub.get('id'), prefix + _clean(sub.get('name', 'folder')) + '/')
+                               for sub in contents.get('folders', [])])
+
+    async def walk(fid, prefix):
+        try:
+            contents = await listing(fid)
+        except Exception as e:
+            unlisted.append((prefix, str(e) or type(e).__name__))
+            return
+        if not isinstance(contents, dict) or 'error' in contents:
+            error = contents.get('error') if isinstance(contents, dict) else None
+            unlisted.append((prefix, str(error or "couldn't list folder")))
+            return
+        await collect(contents, prefix)
+
+    root = await listing(folder_id)
+    if not isinstance(root, dict) or 'error' in root:
+        error = root.get('error') if isinstance(root, dict) else None
+        raise RuntimeError(f"Couldn't list folder: {error or 'no listing returned'}")
+    export = LinkExport(root.get('name', 'Folder'))
+    await collect(root, _clean(export.name) + '/')
+    export.failed.extend(unlisted)
+
+    async def fetch(path, file):
+        file_id = str(file.get('id') or file.get('file_id') or file.get('folder_file_id'))
+        try:
+            async with limit:
+                response = await account.fetchFile(fileId=file_id)
+        except Exception as e:
+            export.failed.append((path, str(e) or type(e).__name__))
+            return
+        if response.get('url'):
+            export.entries.append((path, int(file.get('size', 0) or 0), response['url']))
+        else:
+            export.failed.append((path, response.get('error') or 'no link returned'))
+
+    await asyncio.gather(*[fetch(path, file) for path, file in files])
+    export.entries.sort()
+    return export
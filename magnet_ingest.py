@@ -0,0 +1,162 @@
+import asyncio
+import base64
+import hashlib
+import re
+from urllib.parse import parse_qs, unquote, urlparse
+
+MAGNET_RE = re.compile(r'magnet:\?[^\s<>"\']+', re.IGNORECASE)
+
+
+def extract_magnets(text):
+    """All magnet links in a block of text, in order"""
+    return MAGNET_RE.findall(text or '')
+
+
+def magnet_info_hash(magnet):
+    """Lower-case hex info-hash of a magnet link, or None if it has no btih"""
+    for xt in parse_qs(urlparse(magnet).query).get('xt', []):
+        xt = unquote(xt)
+        if not xt.lower().startswith('urn:btih:'):
+            continue
+        value = xt[9:]
+        if len(value) == 40:
+            return value.lower()
+        if len(value) == 32:
+            try:
+                return base64.b32decode(value.upper()).hex()
+            except ValueError:
+                return None
+    return None
+
+
+def magnet_name(magnet):
+    """Display name (dn) of a magnet link, if it has one"""
+    names = parse_qs(urlparse(magnet).query).get('dn')
+    return unquote(names[0]) if names else None
+
+
+def _skip_bencoded(data, i):
+    """Index just past the bencoded value starting at data[i]"""
+    c = data[i:i + 1]
+    if c == b'i':
+        return data.index(b'e', i) + 1
+    if c in (b'l', b'd'):
+        i += 1
+        while data[i:i + 1] != b'e':
+            i = _skip_bencoded(data, i)
+        return i + 1
+    colon = data.index(b':', i)
+    return colon + 1 + int(data[i:colon])
+
+
+def torrent_info_hash(data):
+    """Hex SHA-1 of the bencoded info dict of a .torrent file, or None if it is malformed"""
+    try:
+        if data[:1] != b'd':
+            return None
+        i = 1
+        while data[i:i + 1] != b'e':
+            colon = data.index(b':', i)
+            key_end = colon + 1 + int(data[i:colon])
+            key = data[colon + 1:key_end]
+            value_end = _skip_bencoded(data, key_end)
+            if key == b'info':
+                return hashlib.sha1(data[key_end:value_end]).hexdigest()
+            i = value_end
+    except (ValueError, IndexError):
+        return None
+    return None
+
+
+class IngestItem:
+    __slots__ = ('label', 'info_hash', 'magnet', 'torrent_file', 'response', 'error')
+
+    def __init__(self, label, info_hash, magnet=None, torrent_file=None):
+        self.label = label
+        self.info_hash = info_hash
+        self.magnet = magnet
+        self.torrent_file = torrent_file
+        self.response = None
+        self.error = None
+
+
+class IngestResult:
+    def __init__(self):
+        self.added = []
+        self.duplicates = []
+        self.failed = []
+
+
+def _listed_torrent(listing, info_hash):
+    """addTorrent-style response for a torrent with this info-hash in a root listing, or None"""
+    for torrent in listing.get('torrents', []):
+        if (torrent.get('hash') or '').lower() == info_hash:
+            return {'result': True, 'user_torrent_id': torrent.get('id'), 'torrent_hash': torrent.get('hash'),
+                    'title': torrent.get('name')}
+    return None
+
+
+async def ingest(account, items, existing_hashes=(), concurrency=4, retries=3, backoff=1.0, list_root=None):
+    """Submit magnets and .torrent files to Seedr with bounded concurrency.
+
+    Items are de-duplicated by info-hash (within the batch and against
+    `existing_hashes`); an explicit rejection from Seedr is reported as-is.
+    A call that raises (or times out) may still have reached Seedr, so it is
+    only retried, with exponential backoff, once `list_root()` shows that the
+    torrent's info-hash is not in the account; if it is, the item counts as
+    added. Without `list_root` or a known info-hash, failed calls are not retried.
+    """
+    result = IngestResult()
+    seen = {h.lower() for h in existing_hashes if h}
+    queue = []
+    for item in items:
+        if item.info_hash and item.info_hash in seen:
+            result.duplicates.append(item)
+            continue
+        if item.info_hash:
+            seen.add(item.info_hash)
+        queue.append(item)
+
+    limit = asyncio.Semaphore(concurrency)
+
+    async def already_added(item):
+        try:
+            listing = await list_root()
+        except Exception:
+            listing = None
+        if not isinstance(listing, dict) or 'error' in listing:
+            return None  # can't tell, so don't risk adding it twice
+        item.response = _listed_torrent(listing, item.info_hash)
+        return item.response is not None
+
+    async def submit(item):
+        async with limit:
+            for attempt in range(retries + 1):
+                try:
+                    if item.magnet:
+                        response = await account.addTorrent(magnetLink=item.magnet)
+                    else:
+                        response = await account.addTorrent(torrentFile=item.torrent_file)
+                except Exception as e:
+                    item.error = str(e) or type(e).__name__
+                    if attempt == retries or not (list_root and item.info_hash):
+                        return
+                    # Give Seedr a moment to list a torrent the failed call did add
+                    await asyncio.sleep(backoff * 2 ** attempt)
+                    added = await already_added(item)
+                    if added is not False:
+                        if added:
+                            item.error = None
+                        return
+                    continue
+                if response.get('result'):
+                    item.response = response
+                    item.error = None
+                else:
+                    item.error = response.get('error') or 'rejected by Seedr'
+                return
+
+    await asyncio.gather(*[submit(item) for item in queue])
+    for item in queue:
+        (result.added if item.response else result.failed).append(item)
+    return result
@@ -1,115 +1,415 @@
 import asyncio
+import io
 import os
-import json
+import tempfile
 import time
-from pathlib import Path
-from telethon import TelegramClient, events
+from telethon import TelegramClient, errors, events
 from telethon.tl.custom import Button
-from seedrcc import Login, Seedr
-from cryptography.fernet import Fernet
+from seedrcc import Login
+from auth_manager import AuthManager
+from seedr_client import SeedrExecutor, CallCoordinator, AsyncLogin, cancel_superseded
+from session_cache import SessionCache
+from folder_cache import FolderCache
+from callbacks import CallbackRouter
+from auth_poller import AuthPoller
+from expiry import ExpiryService
+from torrent_tracker import TorrentTracker
+from send_queue import Outbox
+from archive_jobs import ArchiveJobs
+from file_index import FileIndex
+from storage_stats import StorageStats
+from link_cache import LinkCache
+from link_export import export_folder_links
+from metrics import metrics, instrumented
+from state_backend import open_state_backend
+from profiling import Profiler, ProfilerBusy
+from magnet_ingest import IngestItem, extract_magnets, ingest, magnet_info_hash, magnet_name, torrent_info_hash
 
 # Configuration
 API_ID = int(os.getenv('TELEGRAM_API_ID'))  # Changed to standard naming
 API_HASH = os.getenv('TELEGRAM_API_HASH')
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY')  # Generate with Fernet.generate_key()
-
-class AuthManager:
-    def __init__(self, storage_file='user_tokens.json'):
-        self.storage_file = Path(storage_file)
-        self.fernet = Fernet(ENCRYPTION_KEY) if ENCRYPTION_KEY else None
-        self._ensure_storage()
-
-    def _ensure_storage(self):
-        if not self.storage_file.exists():
-            with open(self.storage_file, 'w') as f:
-                json.dump({}, f)
-
-    def _encrypt(self, data):
-        return self.fernet.encrypt(data.encode()).decode() if self.fernet else data
-
-    def _decrypt(self, data):
-        return self.fernet.decrypt(data.encode()).decode() if self.fernet and data else data
-
-    def save_token(self, user_id, token):
-        data = self._load_data()
-        data[str(user_id)] = {
-            'token': self._encrypt(token),
-            'last_updated': int(time.time())
-        }
-        self._save_data(data)
-
-    def get_token(self, user_id):
-        data = self._load_data()
-        if str(user_id) in data:
-            return self._decrypt(data[str(user_id)]['token'])
-        return None
-
-    def _load_data(self):
-        try:
-            with open(self.storage_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-
-    def _save_data(self, data):
-        temp_file = f"{self.storage_file}.tmp"
-        with open(temp_file, 'w') as f:
-            json.dump(data, f, indent=2)
-        os.replace(temp_file, self.storage_file)
-
-# Initialize clients
-client = TelegramClient('seedr_bot', API_ID, API_HASH).start(bot_token=BOT_TOKEN)
-auth_manager = AuthManager()
+TOKEN_STORE = os.getenv('TOKEN_STORE', 'user_tokens.json')  # Use a .db path for SQLite
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', '60'))  # Seconds to keep decrypted tokens
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+SEEDR_WORKERS = int(os.getenv('SEEDR_WORKERS', '16'))  # Threads for blocking Seedr calls
+SEEDR_TIMEOUT = float(os.getenv('SEEDR_TIMEOUT', '30'))  # Seconds per Seedr call
+SEEDR_PER_ACCOUNT = int(os.getenv('SEEDR_PER_ACCOUNT', '4'))  # Concurrent Seedr calls per user
+SESSION_TTL = int(os.getenv('SESSION_TTL', '300'))  # Seconds before re-running testToken
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', '3600'))  # Drop sessions idle this long
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '10000'))
+PREWARM_SESSIONS = os.getenv('PREWARM_SESSIONS', '0') == '1'  # Validate recent users' tokens at startup
+PREWARM_MAX_AGE = int(os.getenv('PREWARM_MAX_AGE', str(30 * 86400)))  # Only tokens saved this recently (seconds)
+PREWARM_CONCURRENCY = int(os.getenv('PREWARM_CONCURRENCY', '8'))  # Keep most of the Seedr pool for live traffic
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '10'))  # Folders/files per listing page
+CALLBACK_TOKEN_TTL = int(os.getenv('CALLBACK_TOKEN_TTL', '86400'))  # Lifetime of oversized button payloads
+TRACKER_MAX_OUTSTANDING = int(os.getenv('TRACKER_MAX_OUTSTANDING', '8'))  # Concurrent progress polls
+AUTH_POLL_CONCURRENCY = int(os.getenv('AUTH_POLL_CONCURRENCY', str(max(1, SEEDR_WORKERS // 4))))  # Concurrent login polls
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '25'))  # Outgoing messages/edits per second, all chats
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))  # Outgoing messages/edits per second, per chat
+INGEST_CONCURRENCY = int(os.getenv('INGEST_CONCURRENCY', '4'))  # Parallel addTorrent calls per import
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # Largest .torrent / .txt upload we download
+ARCHIVE_CONCURRENCY = int(os.getenv('ARCHIVE_CONCURRENCY', '2'))  # createArchive jobs running at once
+ARCHIVE_TIMEOUT = float(os.getenv('ARCHIVE_TIMEOUT', '600'))  # Seconds to wait for one archive
+STORAGE_CACHE_TTL = int(os.getenv('STORAGE_CACHE_TTL', '30'))  # Seconds to reuse a quota response
+STORAGE_SAMPLE_INTERVAL = int(os.getenv('STORAGE_SAMPLE_INTERVAL', '3600'))  # Seconds between usage samples
+FILE_INDEX_TTL = int(os.getenv('FILE_INDEX_TTL', '300'))  # Seconds before /find re-checks the folder tree
+LINK_CACHE_SIZE = int(os.getenv('LINK_CACHE_SIZE', '50000'))  # Generated download links kept for reuse
+EXPORT_CONCURRENCY = int(os.getenv('EXPORT_CONCURRENCY', '4'))  # Parallel fetchFile calls per link export
+ADMIN_IDS = {int(x) for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip()}  # Users allowed to /profile
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '30'))  # Longest CPU profile / sampling run
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # Serve Prometheus metrics on 127.0.0.1 (0 = off; worker i uses +1+i)
+FOLDER_CACHE_TTL = int(os.getenv('FOLDER_CACHE_TTL', '60'))  # Seconds to reuse a folder listing
+FOLDER_CACHE_ENTRIES = int(os.getenv('FOLDER_CACHE_ENTRIES', '5000'))
+FOLDER_CACHE_BYTES = int(os.getenv('FOLDER_CACHE_BYTES', str(64 * 1024 * 1024)))
+WORKERS = int(os.getenv('WORKERS', '1'))  # Handler processes, users are sharded by id (needs a .db TOKEN_STORE)
+STATE_BACKEND = os.getenv('STATE_BACKEND', '')  # Empty keeps button ids and links in-process; a .db path shares them
+TELEGRAM_SESSION = os.getenv('TELEGRAM_SESSION', 'seedr_bot')  # Empty for an in-memory session
+
+# Initialize clients (the Telegram connection is only opened when run as a script)
+client = TelegramClient(TELEGRAM_SESSION or None, API_ID, API_HASH)
+expiry_service = ExpiryService()  # Evicts TTL state in the background
+state_backend = open_state_backend(STATE_BACKEND, expiry=expiry_service)  # Caches shared between workers
+outbox = Outbox(global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE)  # Rate-limited sends and edits
+auth_manager = AuthManager(TOKEN_STORE, encryption_key=ENCRYPTION_KEY,
+                           token_cache_size=TOKEN_CACHE_SIZE, token_cache_ttl=TOKEN_CACHE_TTL,
+                           expiry=expiry_service)
+seedr_executor = SeedrExecutor(max_workers=SEEDR_WORKERS, timeout=SEEDR_TIMEOUT)
+seedr_calls = CallCoordinator(per_account_limit=SEEDR_PER_ACCOUNT)
+storage_stats = StorageStats(ttl=STORAGE_CACHE_TTL, sample_interval=STORAGE_SAMPLE_INTERVAL,
+                             expiry=expiry_service)  # Quota cache and usage history
+link_cache = LinkCache(max_entries=LINK_CACHE_SIZE, expiry=expiry_service, backend=state_backend)  # fetchFile links, valid 24h
+
+
+def on_account_mutation(user_id):
+    """Drop everything cached about a user's files after a change to their account"""
+    folder_cache.invalidate_user(user_id)
+    archive_jobs.invalidate_user(user_id)
+    storage_stats.invalidate(user_id)
+    file_index.mark_stale(user_id)
+
+
+folder_cache = FolderCache(ttl=FOLDER_CACHE_TTL, max_entries=FOLDER_CACHE_ENTRIES,
+                           max_bytes=FOLDER_CACHE_BYTES, expiry=expiry_service)
+file_index = FileIndex(folder_cache.list_contents, ttl=FILE_INDEX_TTL)  # Whole-tree index behind /find
+session_cache = SessionCache(seedr_executor, ttl=SESSION_TTL, idle_ttl=SESSION_IDLE_TTL,
+                             max_entries=SESSION_CACHE_SIZE, on_mutation=on_account_mutation,
+                             coordinator=seedr_calls)
 
 # Dictionary to track ongoing authentications
 ongoing_auths = {}
 
+# Inline button routing: every callback carries a one-letter opcode
+router = CallbackRouter(token_ttl=CALLBACK_TOKEN_TTL, expiry=expiry_service, backend=state_backend)
+callback_data = router.encode
+
+OP_START_AUTH = 'A'
+OP_CHECK_AUTH = 'C'
+OP_CANCEL_AUTH = 'X'
+OP_UNLINK = 'U'
+OP_MAIN_MENU = 'M'
+OP_LIST_FOLDERS = 'L'  # [page]
+OP_REFRESH_FOLDERS = 'R'
+OP_STORAGE = 'S'
+OP_FOLDER = 'F'  # folder_id [page]
+OP_REFRESH_FOLDER = 'Y'  # folder_id
+OP_FILE = 'I'  # file_id folder_id
+OP_DOWNLOAD_FOLDER = 'Z'  # folder_id
+OP_DELETE_FILE = 'K'  # file_id
+OP_EXPORT_LINKS = 'E'  # folder_id
+OP_FIND = 'Q'  # query page
+OP_NOOP = 'N'  # page indicator, only acknowledges the press
+
+# Buttons sent before the compact encoding
+for legacy_pattern, legacy_op in [
+    (b'start_auth', OP_START_AUTH),
+    (b'check_auth', OP_CHECK_AUTH),
+    (b'cancel_auth', OP_CANCEL_AUTH),
+    (b'unlink_account', OP_UNLINK),
+    (b'main_menu', OP_MAIN_MENU),
+    (b'list_folders', OP_LIST_FOLDERS),
+    (b'refresh_folders', OP_REFRESH_FOLDERS),
+    (b'check_storage', OP_STORAGE),
+    (rb'download_folder_(.*)', OP_DOWNLOAD_FOLDER),
+    (rb'delete_file_(.*)', OP_DELETE_FILE),
+    (rb'refresh_files_(.*)', OP_REFRESH_FOLDER),
+    (rb'folder_(.*)', OP_FOLDER),
+    (rb'file_(.*)_(.*)', OP_FILE),
+]:
+    router.add_legacy(legacy_pattern, legacy_op)
+
 async def get_user_account(user_id):
     """Get or initialize a Seedr account for a user"""
     token = auth_manager.get_token(user_id)
     if token:
-        account = Seedr(token=token)
         try:
-            if account.testToken().get('result'):
-                return account
+            return await session_cache.get(user_id, token)
         except Exception:
             pass
     return None
 
 
+# Helper to render a text progress bar
+def progress_bar(percent, width=10):
+    filled = int(min(max(percent, 0), 100) / 100 * width)
+    return "▰" * filled + "▱" * (width - filled)
+
+
+async def tracker_list_root(user_id, account):
+    """Root listing for the torrent tracker; also refreshes the folder cache"""
+    return await folder_cache.list_contents(user_id, account, 0, refresh=True)
+
+
+async def on_torrent_progress(tracked, torrent):
+    """Edit the /addmagnet message in place with the torrent's latest progress"""
+    rate = int(torrent.get('download_rate') or 0) / (1024 ** 2)
+    try:
+        await outbox.edit_message(
+            client, tracked.chat_id, tracked.message_id,
+            f"⏬ **{tracked.name}**\n\n"
+            f"{progress_bar(tracked.progress)} {tracked.progress:.1f}%\n"
+            f"Speed: {rate:.2f} MB/s"
+        )
+    except Exception:
+        pass  # message deleted or unchanged; keep tracking
+
+
+async def on_torrent_finished(tracked, status):
+    """Replace the progress message with the torrent's final state"""
+    if status == 'done':
+        msg = f"✅ **{tracked.name}** finished downloading!"
+    elif status == 'timeout':
+        msg = f"⌛ **{tracked.name}** is still downloading. Use /folders to check on it."
+    else:
+        msg = f"❌ **{tracked.name}** is no longer in your Seedr account."
+    try:
+        await outbox.edit_message(client, tracked.chat_id, tracked.message_id, msg,
+                                  buttons=[Button.inline("📂 List Folders", callback_data(OP_LIST_FOLDERS))])
+    except Exception:
+        import traceback
+        traceback.print_exc()
+
+
+torrent_tracker = TorrentTracker(tracker_list_root, on_torrent_progress, on_torrent_finished,
+                                 max_outstanding=TRACKER_MAX_OUTSTANDING)
+
+
+def render_search_results(query, results, page=0):
+    """Build the message and keyboard for one page of /find results"""
+    visible, page, total_pages = paginate(results, page)
+    msg = f"🔎 **{len(results)} files matching** `{query}`"
+    if total_pages > 1:
+        msg += f" (page {page + 1} of {total_pages})"
+    msg += "\n\n" + "\n".join(
+        f"📄 {entry.path} - {entry.size / (1024 ** 2):.2f} MB" for entry in visible
+    )
+    buttons = [
+        [Button.inline(f"⬇️ {entry.name}", callback_data(OP_FILE, entry.file_id, entry.folder_id))]
+        for entry in visible
+    ]
+    buttons.extend(create_page_buttons(page, total_pages, lambda p: callback_data(OP_FIND, query, p)))
+    return msg, buttons
+
+
+def render_storage(user_id, response):
+    """Build the storage message, with usage trends from the sampled history"""
+    gb = 1024 ** 3
+    max_space = int(response['space_max']) / gb
+    used_space = int(response['space_used']) / gb
+    percent_used = (used_space / max_space) * 100
+
+    msg = (
+        "💾 **Your Seedr Storage**\n\n"
+        f"▰ Used: **{used_space:.2f}GB** ({percent_used:.1f}%)\n"
+        f"▰ Free: **{(max_space - used_space):.2f}GB**\n"
+        f"▰ Total: **{max_space:.2f}GB**\n\n"
+        f"📊 Bandwidth Used: {int(response['bandwidth_used']) / gb:.2f}GB"
+    )
+
+    trends = []
+    for label, window in (("24h", 86400), ("7d", 7 * 86400)):
+        change = storage_stats.trend(user_id, window)
+        if change is None:
+            continue
+        space, bandwidth, covered = change
+        line = f"▰ {label}: {space / gb:+.2f}GB stored"
+        if bandwidth >= 0:  # bandwidth counters reset every billing period
+            line += f", {bandwidth / gb:.2f}GB bandwidth"
+        if covered < window * 0.9:
+            line += f" (last {covered / 3600:.0f}h sampled)"
+        trends.append(line)
+    if trends:
+        msg += "\n\n📈 **Trend**\n" + "\n".join(trends)
+    return msg, [Button.inline("🔄 Refresh", callback_data(OP_STORAGE))]
+
+
+def render_download_link(cached, file_id, file=None, folder_id=None):
+    """Build the message and keyboard for a (possibly cached) fetchFile link"""
+    response, expires_at = cached
+    msg = "🔗 **Download Ready**\n"
+    if file:
+        msg += f"📄 {file.get('name', 'File')}\n"
+        msg += f"Size: {int(file.get('size', 0)) / (1024 ** 2):.2f}MB\n"
+    else:
+        msg += f"📄 {response.get('name', 'file')}\n"
+    msg += f"Link valid until {time.strftime('%Y-%m-%d %H:%M', time.localtime(expires_at))}"
+
+    actions = [Button.inline("🗑️ Delete", callback_data(OP_DELETE_FILE, file_id))]
+    if folder_id is not None:
+        actions.append(Button.inline("⬅️ Back", callback_data(OP_FOLDER, folder_id)))
+    return msg, [[Button.url("⬇️ Download Now", response['url'])], actions]
+
+
+def render_archive_job(job):
+    """Build the status message and keyboard for an archive job"""
+    if job.status == 'done':
+        return (
+            f"✅ **{job.name} Archive Ready**\n"
+            f"🔗 {job.url}\n\n"
+            f"⚠️ Link expires {time.strftime('%Y-%m-%d %H:%M', time.localtime(job.finished_at + 86400))}",
+            [[Button.url("📦 Download Archive", job.url)]]
+        )
+    if job.status == 'failed':
+        return (f"❌ Failed to create archive of **{job.name}**: {job.error}",
+                [[Button.inline("🔄 Retry", callback_data(OP_DOWNLOAD_FOLDER, job.folder_id))]])
+    if job.status == 'running':
+        return f"⏳ Creating ZIP archive of **{job.name}**... (This may take minutes for large folders)", None
+    return f"⏳ Archive of **{job.name}** is queued behind other archives...", None
+
+
+async def on_archive_update(job, chat_id, message_id):
+    """Edit an archive status message as its job starts and finishes"""
+    text, buttons = render_archive_job(job)
+    await outbox.edit_message(client, chat_id, message_id, text, buttons=buttons)
+
+
+archive_jobs = ArchiveJobs(on_archive_update, max_running=ARCHIVE_CONCURRENCY, timeout=ARCHIVE_TIMEOUT,
+                           expiry=expiry_service)
+
+
+# Helper to cut a listing down to the page being shown
+def paginate(items, page, page_size=None):
+    page_size = page_size or PAGE_SIZE
+    total_pages = max(1, -(-len(items) // page_size))
+    page = min(max(page, 0), total_pages - 1)
+    return items[page * page_size:(page + 1) * page_size], page, total_pages
+
+
+# Helper function to create the Prev / page N of M / Next row
+def create_page_buttons(page, total_pages, page_data):
+    if total_pages <= 1:
+        return []
+    row = []
+    if page > 0:
+        row.append(Button.inline("◀️ Prev", data=page_data(page - 1)))
+    row.append(Button.inline(f"📄 {page + 1}/{total_pages}", data=callback_data(OP_NOOP)))
+    if page < total_pages - 1:
+        row.append(Button.inline("Next ▶️", data=page_data(page + 1)))
+    return [row]
+
+
 # Helper function to create folder keyboard
-def create_folder_keyboard(folders):
+def create_folder_keyboard(folders, page=0, total_pages=1):
     buttons = []
     for folder in folders:
         # Safely get folder ID and name
         folder_id = str(folder.get('id', '0'))
         folder_name = folder.get('name', 'Unnamed Folder')
         buttons.append(
-            [Button.inline(f"📁 {folder_name}", data=f"folder_{folder_id}")]
+            [Button.inline(f"📁 {folder_name}", data=callback_data(OP_FOLDER, folder_id))]
         )
-    buttons.append([Button.inline("🔄 Refresh", data="refresh_folders")])
-    buttons.append([Button.inline("🏠 Root Folder", data="folder_0")])
+    buttons.extend(create_page_buttons(page, total_pages, lambda p: callback_data(OP_LIST_FOLDERS, p)))
+    buttons.append([Button.inline("🔄 Refresh", data=callback_data(OP_REFRESH_FOLDERS))])
+    buttons.append([Button.inline("🏠 Root Folder", data=callback_data(OP_FOLDER, 0))])
     return buttons
 
 
 # Helper function to create file keyboard
-def create_file_keyboard(files, folder_id):
+def create_file_keyboard(files, folder_id, page=0, total_pages=1):
     buttons = []
     for file in files:
         # More robust file ID extraction
         file_id = str(file.get('folder_file_id') or file.get('id') or file.get('file_id') or '0')
         file_name = file.get('name', 'Unnamed File')
         buttons.append(
-            [Button.inline(f"📄 {file_name}", data=f"file_{file_id}_{folder_id}")]
+            [Button.inline(f"📄 {file_name}", data=callback_data(OP_FILE, file_id, folder_id))]
         )
-    buttons.append([Button.inline("⬅️ Back to Folders", data="list_folders")])
-    buttons.append([Button.inline("🔄 Refresh", data=f"refresh_files_{folder_id}")])
+    buttons.extend(create_page_buttons(page, total_pages, lambda p: callback_data(OP_FOLDER, folder_id, p)))
+    buttons.append([Button.inline("⬅️ Back to Folders", data=callback_data(OP_LIST_FOLDERS))])
+    buttons.append([Button.inline("🔄 Refresh", data=callback_data(OP_REFRESH_FOLDER, folder_id))])
     return buttons
 
 
+def render_folder_list(folders, page=0):
+    """Build the message and keyboard for one page of the root folder list"""
+    visible, page, total_pages = paginate(folders, page)
+    msg = "📂 **Your Folders**"
+    if total_pages > 1:
+        msg += f" (page {page + 1} of {total_pages})"
+    msg += "\n\n" + "\n".join([
+        f"• {f.get('name', 'Unnamed')} (ID: `{f.get('id', '?')}`)"
+        for f in visible
+    ])
+    return msg, create_folder_keyboard(visible, page, total_pages)
+
+
+def render_folder_contents(contents, folder_id, page=0):
+    """Build the message and keyboard for one page of a folder's subfolders and files"""
+    entries = [('folder', f) for f in contents.get('folders', [])] + \
+              [('file', f) for f in contents.get('files', [])]
+    visible, page, total_pages = paginate(entries, page)
+
+    msg = f"📂 **{contents.get('name', 'Folder')}**"
+    if total_pages > 1:
+        msg += f" (page {page + 1} of {total_pages})"
+    msg += "\n\n"
+
+    folders = [f for kind, f in visible if kind == 'folder']
+    files = [f for kind, f in visible if kind == 'file']
+
+    if folders:
+        msg += "📁 **Subfolders**\n" + "\n".join([
+            f"• {f.get('name', 'Unnamed')} (ID: `{f.get('id', '?')}`)"
+            for f in folders
+        ]) + "\n\n"
+
+    if files:
+        msg += "**Files:**\n"
+        for file in files:
+            file_name = file.get('name', 'Unnamed File')
+            # Try multiple possible ID fields
+            file_id = str(file.get('folder_file_id') or file.get('id') or file.get('file_id') or '0')
+            file_size = int(file.get('size', 0)) / (1024 ** 2)
+            msg += f"📄 {file_name} (ID: `{file_id}`) - {file_size:.2f} MB\n"
+
+    buttons = []
+    if entries:
+        buttons.append([
+            Button.inline("📦 Download All", callback_data(OP_DOWNLOAD_FOLDER, folder_id)),
+            Button.inline("🔗 Export Links", callback_data(OP_EXPORT_LINKS, folder_id))
+        ])
+
+    buttons.extend([
+        [Button.inline(f"📁 {f.get('name', 'Folder')}", callback_data(OP_FOLDER, f.get('id')))]
+        for f in folders
+    ])
+    buttons.extend([
+        [Button.inline(f"⬇️ {f.get('name', 'File')}", callback_data(OP_FILE, f.get('id'), folder_id))]
+        for f in files
+    ])
+    buttons.extend(create_page_buttons(page, total_pages, lambda p: callback_data(OP_FOLDER, folder_id, p)))
+
+    buttons.append([
+        Button.inline("🔄 Refresh", callback_data(OP_REFRESH_FOLDER, folder_id)),
+        Button.inline("⬅️ Back", callback_data(OP_LIST_FOLDERS))
+    ])
+    return msg, buttons
+
+
 # Command handlers
 @client.on(events.NewMessage(pattern='/start'))
+@instrumented
 async def start_handler(event):
     """Handle /start command with user authentication flow"""
     user_id = event.sender_id
@@ -117,9 +417,8 @@ async def start_handler(event):
 
     # Check if user already has a valid token
     if user_token:
-        account = Seedr(token=user_token)
         try:
-            if account.testToken().get('result'):
+            if await session_cache.get(user_id, user_token):
                 welcome_msg = """
                 🌟 **Seedr Account Manager** 🌟
 
@@ -128,15 +427,16 @@ async def start_handler(event):
                 **Available Commands:**
                 /folders - List your folders
                 /storage - Check account usage
+                /find - Search all your files
                 /addmagnet - Add torrent via magnet link
                 /help - Show help
                 """
                 buttons = [
-                    [Button.inline("📂 List Folders", "list_folders")],
-                    [Button.inline("💾 Check Storage", "check_storage")],
-                    [Button.inline("🔗 Unlink Account", "unlink_account")]
+                    [Button.inline("📂 List Folders", callback_data(OP_LIST_FOLDERS))],
+                    [Button.inline("💾 Check Storage", callback_data(OP_STORAGE))],
+                    [Button.inline("🔗 Unlink Account", callback_data(OP_UNLINK))]
                 ]
-                await event.respond(welcome_msg, buttons=buttons)
+                await outbox.respond(event, welcome_msg, buttons=buttons)
                 return
         except Exception:
             pass  # Token is invalid, proceed to auth flow
@@ -153,28 +453,109 @@ async def start_handler(event):
     3. Wait for you to confirm
     """
     buttons = [
-        [Button.inline("🔗 Connect Seedr Account", "start_auth")],
+        [Button.inline("🔗 Connect Seedr Account", callback_data(OP_START_AUTH))],
         [Button.url("ℹ️ What is Seedr?", "https://seedr.cc")]
     ]
-    await event.respond(welcome_msg, buttons=buttons)
+    await outbox.respond(event, welcome_msg, buttons=buttons)
+
+
+AUTH_SUCCESS_MSG = (
+    "✅ Account connected successfully!\n\n"
+    "You can now use all Seedr features."
+)
+
+
+def auth_success_buttons():
+    return [
+        [Button.inline("📂 List Folders", callback_data(OP_LIST_FOLDERS))],
+        [Button.inline("🏠 Main Menu", callback_data(OP_MAIN_MENU))]
+    ]
+
+
+def complete_auth(user_id, auth_data):
+    """Save the token of a finished login; False if the session was already completed or cancelled"""
+    if ongoing_auths.get(user_id) is not auth_data:
+        return False
+    del ongoing_auths[user_id]
+    auth_manager.save_token(user_id, auth_data['login_instance'].token)
+    session_cache.invalidate(user_id)
+    on_account_mutation(user_id)
+    link_cache.invalidate_user(user_id)
+    file_index.drop(user_id)
+    torrent_tracker.drop(user_id)
+    return True
+
+
+async def on_auth_polled(user_id, auth_data):
+    """Background poller saw the user authorize: link the account and update the auth message"""
+    if complete_auth(user_id, auth_data):
+        await outbox.edit_message(client, auth_data['chat_id'], auth_data['message_id'],
+                                  AUTH_SUCCESS_MSG, buttons=auth_success_buttons())
+
+
+async def on_auth_expired(user_id, auth_data, reason):
+    """Background poller gave up on a session"""
+    if reason == 'expired':
+        msg = "⌛ Authorization session expired. Please start again."
+    else:
+        msg = f"❌ Authorization failed: {reason}"
+    await outbox.edit_message(client, auth_data['chat_id'], auth_data['message_id'], msg,
+                              buttons=[Button.inline("🔗 Try Again", callback_data(OP_START_AUTH))])
+
+
+auth_poller = AuthPoller(ongoing_auths, on_auth_polled, on_auth_expired, max_concurrent=AUTH_POLL_CONCURRENCY)
+
+
+def expire_auth_session(user_id, auth_data):
+    """Backstop eviction for login sessions nobody finished, even if polling stopped"""
+    if ongoing_auths.get(user_id) is auth_data:
+        del ongoing_auths[user_id]
+
+
+expiry_service.track('ongoing_auths', ongoing_auths)
+expiry_service.track('sessions', session_cache)
+expiry_service.track('folder_listings', folder_cache)
+expiry_service.track('decrypted_tokens', auth_manager.token_cache)
+expiry_service.track('callback_short_ids', router.tokens)
+expiry_service.track('tracked_torrents', torrent_tracker)
+expiry_service.track('archive_jobs', archive_jobs)
+expiry_service.track('download_links', link_cache)
+expiry_service.track('usage_histories', storage_stats)
+expiry_service.track('file_indexes', file_index)
+expiry_service.start(client.loop)
+
+metrics.add_gauges('live_state', expiry_service.gauges)
+metrics.add_gauges('seedr_pool', seedr_executor.stats)
+metrics.add_gauges('single_flight', seedr_calls.stats)
+metrics.add_gauges('outbox', outbox.stats)
+if METRICS_PORT:
+    client.loop.create_task(metrics.serve(METRICS_PORT))
 
+profiler = Profiler(max_seconds=PROFILE_MAX_SECONDS, expiry=expiry_service)  # /profile diagnostics
+client.loop.create_task(profiler.monitor_lag())
 
-@client.on(events.CallbackQuery(data=b'start_auth'))
+
+@router.route(OP_START_AUTH)
 async def start_auth_handler(event):
     """Begin Seedr authentication process"""
     user_id = event.sender_id
 
     try:
         # Generate device code
-        seedr = Login()
-        device_code = seedr.getDeviceCode()
+        seedr = AsyncLogin(Login(), seedr_executor)
+        device_code = await seedr.getDeviceCode()
 
-        # Store the login instance for polling
+        # Store the login instance and the message to update for polling
         ongoing_auths[user_id] = {
             'login_instance': seedr,
             'device_code': device_code['device_code'],
-            'expires_at': time.time() + 300  # 5 minute expiry
+            'expires_at': time.time() + 300,  # 5 minute expiry
+            'chat_id': event.chat_id,
+            'message_id': event.message_id
         }
+        auth_poller.add(user_id)
+        # Slightly after the session's own expiry so the poller can report it first
+        expiry_service.call_later(330, expire_auth_session, user_id, ongoing_auths[user_id])
 
         auth_msg = """
         🔑 **Authorization Steps**:
@@ -185,29 +566,29 @@ async def start_auth_handler(event):
         {user_code}
         ```
         3. Click "Authorize"
-        4. Come back here and click "I've Authorized"
+        4. This message updates automatically once you do
         """.format(user_code=device_code['user_code'])
 
         buttons = [
             [Button.url("🔗 Open Authorization", url="https://seedr.cc/devices")],
-            [Button.inline("✅ I've Authorized", data="check_auth")],
-            [Button.inline("❌ Cancel", data="cancel_auth")]
+            [Button.inline("✅ I've Authorized", data=callback_data(OP_CHECK_AUTH))],
+            [Button.inline("❌ Cancel", data=callback_data(OP_CANCEL_AUTH))]
         ]
 
-        await event.edit(auth_msg, buttons=buttons)
+        await outbox.edit(event, auth_msg, buttons=buttons)
     except Exception as e:
-        await event.respond(f"❌ Failed to start authentication: {str(e)}")
+        await outbox.respond(event, f"❌ Failed to start authentication: {str(e)}")
         import traceback
         traceback.print_exc()
 
 
-@client.on(events.CallbackQuery(data=b'check_auth'))
+@router.route(OP_CHECK_AUTH)
 async def check_auth_handler(event):
     """Check if user has completed authorization"""
     user_id = event.sender_id
 
     if user_id not in ongoing_auths:
-        await event.respond("❌ No active authorization session. Start with /start")
+        await outbox.respond(event, "❌ No active authorization session. Start with /start")
         return
 
     auth_data = ongoing_auths[user_id]
@@ -216,51 +597,47 @@ async def check_auth_handler(event):
         # Check if authorization expired
         if time.time() > auth_data['expires_at']:
             del ongoing_auths[user_id]
-            await event.respond("⌛ Authorization session expired. Please start again.")
+            await outbox.respond(event, "⌛ Authorization session expired. Please start again.")
             return
 
-        await event.respond("⏳ Checking authorization...")
-        response = auth_data['login_instance'].authorize(auth_data['device_code'])
+        await outbox.respond(event, "⏳ Checking authorization...")
+        response = await auth_data['login_instance'].authorize(auth_data['device_code'])
 
         if response and 'access_token' in response:
-            # Save the valid token
-            auth_manager.save_token(user_id, auth_data['login_instance'].token)
-            del ongoing_auths[user_id]
-
-            await event.respond(
-                "✅ Account connected successfully!\n\n"
-                "You can now use all Seedr features.",
-                buttons=[
-                    [Button.inline("📂 List Folders", "list_folders")],
-                    [Button.inline("🏠 Main Menu", "main_menu")]]
-            )
+            if complete_auth(user_id, auth_data):
+                await outbox.respond(event, AUTH_SUCCESS_MSG, buttons=auth_success_buttons())
         else:
-            await event.respond("❌ Not authorized yet. Please complete the steps.")
+            await outbox.respond(event, "❌ Not authorized yet. Please complete the steps.")
     except Exception as e:
-        await event.respond(f"❌ Authorization failed: {str(e)}")
+        await outbox.respond(event, f"❌ Authorization failed: {str(e)}")
         import traceback
         traceback.print_exc()
 
 
-@client.on(events.CallbackQuery(data=b'cancel_auth'))
+@router.route(OP_CANCEL_AUTH)
 async def cancel_auth_handler(event):
     """Cancel ongoing authentication"""
     user_id = event.sender_id
     if user_id in ongoing_auths:
         del ongoing_auths[user_id]
-    await event.respond("❌ Authorization cancelled.")
+    await outbox.respond(event, "❌ Authorization cancelled.")
 
 
-@client.on(events.CallbackQuery(data=b'unlink_account'))
+@router.route(OP_UNLINK)
 async def unlink_account_handler(event):
     """Remove stored Seedr credentials"""
     user_id = event.sender_id
-    auth_manager.save_token(user_id, None)  # Clear token
-    await event.respond(
+    auth_manager.delete_user_token(user_id)
+    session_cache.invalidate(user_id)
+    on_account_mutation(user_id)
+    link_cache.invalidate_user(user_id)
+    file_index.drop(user_id)
+    torrent_tracker.drop(user_id)
+    await outbox.respond(event,
         "✅ Account unlinked successfully!\n\n"
         "You can reconnect anytime with /start",
         buttons=[
-            [Button.inline("🔗 Reconnect Account", "start_auth")]
+            [Button.inline("🔗 Reconnect Account", callback_data(OP_START_AUTH))]
         ])
 
 
@@ -270,29 +647,30 @@ async def verify_user(event):
     user_token = auth_manager.get_token(user_id)
 
     if not user_token:
-        await event.respond(
+        await outbox.respond(event,
             "🔒 You need to connect your Seedr account first!\n\n"
             "Use /start to begin authentication.",
-            buttons=[Button.inline("🔗 Connect Account", "start_auth")]
+            buttons=[Button.inline("🔗 Connect Account", callback_data(OP_START_AUTH))]
         )
         return None
 
     try:
-        account = Seedr(token=user_token)
-        if account.testToken().get('result'):
+        account = await session_cache.get(user_id, user_token)
+        if account:
             return account
-        await event.respond(
+        await outbox.respond(event,
             "❌ Your session has expired.\n"
             "Please reconnect your Seedr account.",
-            buttons=[Button.inline("🔗 Reconnect", "start_auth")]
+            buttons=[Button.inline("🔗 Reconnect", callback_data(OP_START_AUTH))]
         )
     except Exception as e:
-        await event.respond(f"❌ Account error: {str(e)}")
+        await outbox.respond(event, f"❌ Account error: {str(e)}")
 
     return None
 
 
 @client.on(events.NewMessage(pattern='/folders'))
+@instrumented
 async def list_folders_handler(event):
     """List all folders in user's Seedr account"""
     account = await verify_user(event)
@@ -300,24 +678,21 @@ async def list_folders_handler(event):
         return
 
     try:
-        response = account.listContents(contentType='folder')
+        response = await folder_cache.list_contents(event.sender_id, account)
         folders = response.get('folders', [])
 
         if not folders:
-            await event.respond("📂 Your Seedr account has no folders yet.")
+            await outbox.respond(event, "📂 Your Seedr account has no folders yet.")
             return
 
-        msg = "📂 **Your Folders:**\n\n"
-        for folder in folders:
-            msg += f"• {folder.get('name', 'Unnamed')} (ID: `{folder.get('id', '?')}`)\n"
-
-        buttons = create_folder_keyboard(folders)
-        await event.respond(msg, buttons=buttons)
+        msg, buttons = render_folder_list(folders)
+        await outbox.respond(event, msg, buttons=buttons)
     except Exception as e:
-        await event.respond(f"❌ Error listing folders: {str(e)}")
+        await outbox.respond(event, f"❌ Error listing folders: {str(e)}")
 
 
 @client.on(events.NewMessage(pattern='/storage'))
+@instrumented
 async def storage_handler(event):
     """Check user's account storage space"""
     account = await verify_user(event)
@@ -325,24 +700,47 @@ async def storage_handler(event):
         return
 
     try:
-        response = account.getMemoryBandwidth()
-        max_space = int(response['space_max']) / (1024 ** 3)  # GB
-        used_space = int(response['space_used']) / (1024 ** 3)  # GB
-        percent_used = (used_space / max_space) * 100
-
-        msg = (
-            "💾 **Your Seedr Storage**\n\n"
-            f"▰ Used: **{used_space:.2f}GB** ({percent_used:.1f}%)\n"
-            f"▰ Free: **{(max_space - used_space):.2f}GB**\n"
-            f"▰ Total: **{max_space:.2f}GB**\n\n"
-            f"📊 Bandwidth Used: {int(response['bandwidth_used']) / (1024 ** 3):.2f}GB"
-        )
-        await event.respond(msg)
+        response = await storage_stats.get(event.sender_id, account)
+        msg, buttons = render_storage(event.sender_id, response)
+        await outbox.respond(event, msg, buttons=buttons)
     except Exception as e:
-        await event.respond(f"❌ Error checking storage: {str(e)}")
+        await outbox.respond(event, f"❌ Error checking storage: {str(e)}")
+
+
+@client.on(events.NewMessage(pattern='/find'))
+@instrumented
+async def find_handler(event):
+    """Search every file in the user's Seedr account by name or path"""
+    account = await verify_user(event)
+    if not account:
+        return
+
+    args = event.message.text.split(maxsplit=1)
+    if len(args) < 2:
+        await outbox.respond(event, "Usage: `/find <words>`\nExample: `/find alien 1979`")
+        return
+
+    query = args[1].strip()
+    try:
+        status = None
+        if not file_index.is_fresh(event.sender_id):
+            status = await outbox.respond(event, "⏳ Indexing your files...")
+        results = (await file_index.ensure(event.sender_id, account)).search(query)
+
+        if results:
+            msg, buttons = render_search_results(query, results)
+        else:
+            msg, buttons = f"🔎 No files matching `{query}`", None
+        if status:
+            await outbox.edit_message(client, status.chat_id, status.id, msg, buttons=buttons)
+        else:
+            await outbox.respond(event, msg, buttons=buttons)
+    except Exception as e:
+        await outbox.respond(event, f"❌ Search error: {str(e)}")
 
 
 @client.on(events.NewMessage(pattern='/download'))
+@instrumented
 async def download_handler(event):
     """Download a file by ID"""
     account = await verify_user(event)
@@ -351,65 +749,131 @@ async def download_handler(event):
 
     args = event.message.text.split()
     if len(args) < 2:
-        await event.respond("Usage: `/download <fileId>`\nExample: `/download 12345`")
+        await outbox.respond(event, "Usage: `/download <fileId>`\nExample: `/download 12345`")
         return
 
     file_id = args[1]
     try:
-        await event.respond("⏳ Generating download link...")
-        response = account.fetchFile(fileId=file_id)
+        cached = link_cache.get(event.sender_id, file_id)
+        if cached:
+            text, buttons = render_download_link(cached, file_id)
+            await outbox.respond(event, text, buttons=buttons)
+            return
+
+        # The status message is edited into the result instead of sending a second message
+        status = await outbox.respond(event, "⏳ Generating download link...")
+        response = await account.fetchFile(fileId=file_id)
 
         if response.get('url'):
-            file_name = response.get('name', 'file')
-            buttons = [
-                [Button.url("⬇️ Download Now", url=response['url'])],
-                [Button.inline("🗑️ Delete File", data=f"delete_file_{file_id}")]
-            ]
-            await event.respond(
-                f"🔗 **Download Ready**\n"
-                f"📄 {file_name}\n"
-                f"Link valid for 24 hours",
-                buttons=buttons
-            )
+            text, buttons = render_download_link(link_cache.set(event.sender_id, file_id, response), file_id)
+            await outbox.edit_message(client, status.chat_id, status.id, text, buttons=buttons)
         else:
-            await event.respond("❌ Couldn't generate download link. Check the file ID.")
+            await outbox.edit_message(client, status.chat_id, status.id,
+                                      "❌ Couldn't generate download link. Check the file ID.")
     except Exception as e:
-        await event.respond(f"❌ Download error: {str(e)}")
+        await outbox.respond(event, f"❌ Download error: {str(e)}")
+
+
+async def collect_ingest_items(event, tmp_dir):
+    """Magnets in the message text plus an attached .txt list of magnets or .torrent file"""
+    items = [
+        IngestItem(magnet_name(magnet) or magnet[:60], magnet_info_hash(magnet), magnet=magnet)
+        for magnet in extract_magnets(event.message.message)
+    ]
+
+    document = event.message.file
+    name = (document.name or '') if document else ''
+    if name.lower().endswith('.txt') and document.size <= MAX_UPLOAD_SIZE:
+        data = await event.message.download_media(file=bytes)
+        items += [
+            IngestItem(magnet_name(magnet) or magnet[:60], magnet_info_hash(magnet), magnet=magnet)
+            for magnet in extract_magnets(data.decode('utf-8', 'ignore'))
+        ]
+    elif name.lower().endswith('.torrent') and document.size <= MAX_UPLOAD_SIZE:
+        data = await event.message.download_media(file=bytes)
+        path = os.path.join(tmp_dir, 'upload.torrent')
+        with open(path, 'wb') as f:
+            f.write(data)
+        items.append(IngestItem(name, torrent_info_hash(data), torrent_file=path))
+    return items
 
 
 @client.on(events.NewMessage(pattern='/addmagnet'))
+@instrumented
 async def add_magnet_handler(event):
-    """Add torrent via magnet link"""
+    """Add torrents from magnet links, a .txt list of magnets or a .torrent file"""
     account = await verify_user(event)
     if not account:
         return
 
-    args = event.message.text.split(maxsplit=1)
-    if len(args) < 2:
-        await event.respond(
-            "Usage: `/addmagnet <magnet_link>`\n\n"
-            "Example: `/addmagnet magnet:?xt=urn:btih:...`"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        items = await collect_ingest_items(event, tmp_dir)
+        if not items:
+            await outbox.respond(event,
+                "Usage: `/addmagnet <magnet_link> [more magnet links...]`\n\n"
+                "Example: `/addmagnet magnet:?xt=urn:btih:...`\n\n"
+                "You can also send a .torrent file or a .txt file with one magnet link per line."
+            )
+            return
+
+        try:
+            noun = "torrent" if len(items) == 1 else f"{len(items)} torrents"
+            msg = await outbox.respond(event, f"⏳ Adding {noun} to your Seedr account...")
+
+            # Skip torrents that are already downloading in the account
+            try:
+                root = await folder_cache.list_contents(event.sender_id, account)
+                existing = [t.get('hash') for t in root.get('torrents', [])]
+            except Exception:
+                existing = []
+
+            result = await ingest(
+                account, items, existing_hashes=existing, concurrency=INGEST_CONCURRENCY,
+                list_root=lambda: folder_cache.list_contents(event.sender_id, account, 0, refresh=True)
+            )
+        except Exception as e:
+            await outbox.respond(event, f"❌ Torrent error: {str(e)}")
+            return
+
+    if len(items) == 1 and result.added:
+        await outbox.edit_message(
+            client, msg.chat_id, msg.id,
+            "✅ Torrent added successfully!\n\n"
+            "It may take several minutes to start downloading.\n"
+            "⏳ Progress will be shown here."
         )
+        torrent_tracker.track(event.sender_id, account, result.added[0].response, msg.chat_id, msg.id)
+        return
+    if len(items) == 1 and result.failed:
+        await outbox.edit_message(client, msg.chat_id, msg.id,
+                                  f"❌ Failed to add torrent: {result.failed[0].error}")
         return
 
-    magnet_link = args[1]
-    try:
-        await event.respond("⏳ Adding torrent to your Seedr account...")
-        response = account.addTorrent(magnetLink=magnet_link)
-
-        if response.get('result'):
-            await event.respond(
-                "✅ Torrent added successfully!\n\n"
-                "It may take several minutes to start downloading.\n"
-                "Use /folders to check progress."
-            )
-        else:
-            await event.respond("❌ Failed to add torrent. The link may be invalid.")
-    except Exception as e:
-        await event.respond(f"❌ Torrent error: {str(e)}")
+    summary = (
+        "📥 **Torrent Import**\n\n"
+        f"✅ Added: {len(result.added)}\n"
+        f"♻️ Duplicates: {len(result.duplicates)}\n"
+        f"❌ Failed: {len(result.failed)}\n"
+    )
+    if result.failed:
+        summary += "\n" + "\n".join(f"• {item.label[:60]}: {item.error}" for item in result.failed[:10])
+        if len(result.failed) > 10:
+            summary += f"\n…and {len(result.failed) - 10} more"
+    await outbox.edit_message(client, msg.chat_id, msg.id, summary,
+                              buttons=[Button.inline("📂 List Folders", callback_data(OP_LIST_FOLDERS))])
+
+
+@client.on(events.NewMessage(func=lambda e: e.message.file is not None
+                             and (e.message.file.name or '').lower().endswith(('.torrent', '.txt'))
+                             and not e.raw_text.startswith('/')))
+@instrumented
+async def torrent_upload_handler(event):
+    """Treat an uploaded .torrent file or .txt magnet list like /addmagnet"""
+    await add_magnet_handler(event)
 
 
 @client.on(events.NewMessage(pattern='/delete'))
+@instrumented
 async def delete_handler(event):
     """Delete file/folder by ID"""
     account = await verify_user(event)
@@ -418,7 +882,7 @@ async def delete_handler(event):
 
     args = event.message.text.split()
     if len(args) < 3:
-        await event.respond(
+        await outbox.respond(event,
             "Usage: `/delete <type> <id>`\n\n"
             "Examples:\n"
             "• `/delete file 12345`\n"
@@ -431,54 +895,52 @@ async def delete_handler(event):
 
     try:
         if item_type == 'file':
-            response = account.deleteFile(fileId=item_id)
+            link_cache.discard(event.sender_id, item_id)
+            response = await account.deleteFile(fileId=item_id)
             success_msg = "🗑️ File deleted successfully!"
         elif item_type == 'folder':
-            response = account.deleteFolder(folderId=item_id)
+            link_cache.invalidate_user(event.sender_id)
+            response = await account.deleteFolder(folderId=item_id)
             success_msg = "🗑️ Folder deleted successfully!"
         else:
-            await event.respond("❌ Invalid type. Use 'file' or 'folder'.")
+            await outbox.respond(event, "❌ Invalid type. Use 'file' or 'folder'.")
             return
 
         if response.get('result'):
-            await event.respond(success_msg)
+            await outbox.respond(event, success_msg)
         else:
-            await event.respond(f"❌ Failed to delete {item_type}.")
+            await outbox.respond(event, f"❌ Failed to delete {item_type}.")
     except Exception as e:
-        await event.respond(f"❌ Deletion error: {str(e)}")
+        await outbox.respond(event, f"❌ Deletion error: {str(e)}")
 
 
 # Callback query handlers
-@client.on(events.CallbackQuery(data=b'list_folders'))
-async def list_folders_callback(event):
+@router.route(OP_LIST_FOLDERS)
+@cancel_superseded
+async def list_folders_callback(event, page=0, refresh=False):
     """Handle folder list callback"""
     account = await verify_user(event)
     if not account:
         return
 
     try:
-        response = account.listContents(contentType='folder')
+        response = await folder_cache.list_contents(event.sender_id, account, refresh=refresh)
         folders = response.get('folders', [])
 
         if not folders:
-            await event.respond("📂 Your Seedr account has no folders yet.")
+            await outbox.respond(event, "📂 Your Seedr account has no folders yet.")
             return
 
-        msg = "📂 **Your Folders**\n\n"
-        msg += "\n".join([
-            f"• {f.get('name', 'Unnamed')} (ID: `{f.get('id', '?')}`)"
-            for f in folders
-        ])
-
-        await event.edit(
-            msg,
-            buttons=create_folder_keyboard(folders)
-        )
+        msg, buttons = render_folder_list(folders, int(page))
+        await outbox.edit(event, msg, buttons=buttons)
+    except errors.MessageNotModifiedError:
+        await event.answer("Folders are up to date")
     except Exception as e:
-        await event.respond(f"❌ Error: {str(e)}")
+        await outbox.respond(event, f"❌ Error: {str(e)}")
 
 
-@client.on(events.CallbackQuery(data=b'check_storage'))
+@router.route(OP_STORAGE)
+@cancel_superseded
 async def check_storage_callback(event):
     """Handle storage check callback"""
     account = await verify_user(event)
@@ -486,98 +948,46 @@ async def check_storage_callback(event):
         return
 
     try:
-        response = account.getMemoryBandwidth()
-        used = int(response['space_used']) / (1024 ** 3)
-        total = int(response['space_max']) / (1024 ** 3)
-
-        await event.edit(
-            f"💾 **Your Storage**\n\n"
-            f"▰ Used: **{used:.2f}GB** of {total:.2f}GB\n"
-            f"▰ {used / total * 100:.1f}% full\n\n"
-            f"📊 Bandwidth: {int(response['bandwidth_used']) / (1024 ** 3):.2f}GB",
-            buttons=[Button.inline("🔄 Refresh", "check_storage")]
-        )
+        response = await storage_stats.get(event.sender_id, account)
+        msg, buttons = render_storage(event.sender_id, response)
+        await outbox.edit(event, msg, buttons=buttons)
+    except errors.MessageNotModifiedError:
+        await event.answer("Storage is up to date")
     except Exception as e:
-        await event.respond(f"❌ Error: {str(e)}")
+        await outbox.respond(event, f"❌ Error: {str(e)}")
 
 
-@client.on(events.CallbackQuery(pattern=b'folder_(.*)'))
-async def folder_contents_callback(event):
+@router.route(OP_FOLDER)
+@cancel_superseded
+async def folder_contents_callback(event, folder_id, page=0, refresh=False):
     """Show folder contents with download options"""
     account = await verify_user(event)
     if not account:
         return
 
-    folder_id = event.pattern_match.group(1).decode()
-
     try:
-        contents = account.listContents(folderId=folder_id)
-        files = contents.get('files', [])
-        folders = contents.get('folders', [])
-
-        msg = f"📂 **{contents.get('name', 'Folder')}**\n\n"
-
-        if folders:
-            msg += "📁 **Subfolders**\n" + "\n".join([
-                f"• {f.get('name', 'Unnamed')} (ID: `{f.get('id', '?')}`)"
-                for f in folders
-            ]) + "\n\n"
-
-        if files:
-            msg += "**Files:**\n"
-            for file in files:
-                file_name = file.get('name', 'Unnamed File')
-                # Try multiple possible ID fields
-                file_id = str(file.get('folder_file_id') or file.get('id') or file.get('file_id') or '0')
-                file_size = int(file.get('size', 0)) / (1024 ** 2)
-                msg += f"📄 {file_name} (ID: `{file_id}`) - {file_size:.2f} MB\n"
-
-        buttons = []
-        if files or folders:
-            buttons.append([
-                Button.inline("📦 Download All", f"download_folder_{folder_id}")
-            ])
-
-        buttons.extend([
-            [Button.inline(f"⬇️ {f.get('name', 'File')}", f"file_{f.get('id')}_{folder_id}")]
-            for f in files  # Limit to 8 files
-        ])
-
-        buttons.append([
-            Button.inline("🔄 Refresh", f"folder_{folder_id}"),
-            Button.inline("⬅️ Back", "list_folders")
-        ])
-
-        await event.edit(msg, buttons=buttons)
+        contents = await folder_cache.list_contents(event.sender_id, account, folder_id, refresh=refresh)
+        msg, buttons = render_folder_contents(contents, folder_id, int(page))
+        await outbox.edit(event, msg, buttons=buttons)
+    except errors.MessageNotModifiedError:
+        await event.answer("Folder is up to date")
     except Exception as e:
-        await event.respond(f"❌ Error: {str(e)}")
+        await outbox.respond(event, f"❌ Error: {str(e)}")
 
 
-@client.on(events.CallbackQuery(pattern=b'file_(.*)_(.*)'))
-async def file_action_callback(event):
+@router.route(OP_FILE)
+async def file_action_callback(event, file_id, folder_id):
     """Handle file download with robust ID handling"""
     account = await verify_user(event)
     if not account:
         return
 
-    file_id, folder_id = event.pattern_match.group(1).decode(), event.pattern_match.group(2).decode()
-
     try:
-        # First verify the file exists and get proper ID
-        folder_contents = account.listContents(folderId=folder_id)
-        files = folder_contents.get('files', [])
-
-        # Find the file by ID (checking multiple possible ID fields)
-        target_file = None
-        for file in files:
-            if (str(file.get('id'))) == file_id or \
-                    str(file.get('file_id')) == file_id or \
-                    str(file.get('folder_file_id')) == file_id:
-                target_file = file
-                break
+        # Resolve the file from the listing the user just saw (any ID alias)
+        target_file = await folder_cache.find_file(event.sender_id, account, folder_id, file_id)
 
         if not target_file:
-            await event.respond("❌ File not found in this folder")
+            await outbox.respond(event, "❌ File not found in this folder")
             return
 
         # Use the most reliable ID field we found
@@ -585,110 +995,163 @@ async def file_action_callback(event):
                              target_file.get('file_id') or
                              target_file.get('folder_file_id'))
 
-        await event.respond("⏳ Generating download link...")
-        response = account.fetchFile(fileId=proper_file_id)
+        cached = link_cache.get(event.sender_id, proper_file_id)
+        if cached:
+            text, buttons = render_download_link(cached, proper_file_id, target_file, folder_id)
+            await outbox.respond(event, text, buttons=buttons)
+            return
+
+        status = await outbox.respond(event, "⏳ Generating download link...")
+        response = await account.fetchFile(fileId=proper_file_id)
 
         if response.get('url'):
-            file_name = target_file.get('name', 'File')
-            file_size = int(target_file.get('size', 0)) / (1024 ** 2)
-
-            buttons = [
-                [Button.url("⬇️ Download Now", response['url'])],
-                [
-                    Button.inline("🗑️ Delete", f"delete_file_{proper_file_id}"),
-                    Button.inline("⬅️ Back", f"folder_{folder_id}")
-                ]
-            ]
-
-            await event.respond(
-                f"🔗 **Download Ready**\n"
-                f"📄 {file_name}\n"
-                f"Size: {file_size:.2f}MB\n"
-                f"Link valid for 24 hours",
-                buttons=buttons
-            )
+            text, buttons = render_download_link(link_cache.set(event.sender_id, proper_file_id, response),
+                                                 proper_file_id, target_file, folder_id)
+            await outbox.edit_message(client, status.chat_id, status.id, text, buttons=buttons)
         else:
             debug_msg = (
                 "❌ Failed to generate download link\n\n"
                 f"File ID used: {proper_file_id}\n"
                 f"API Response: {response}"
             )
-            await event.respond(debug_msg)
+            await outbox.edit_message(client, status.chat_id, status.id, debug_msg)
     except Exception as e:
         error_msg = (
             f"❌ Download Error: {str(e)}\n\n"
             f"File ID attempted: {file_id}\n"
             f"Folder ID: {folder_id}"
         )
-        await event.respond(error_msg)
+        await outbox.respond(event, error_msg)
         import traceback
         traceback.print_exc()
 
 
-@client.on(events.CallbackQuery(pattern=b'download_folder_(.*)'))
-async def download_folder_callback(event):
+@router.route(OP_DOWNLOAD_FOLDER)
+async def download_folder_callback(event, folder_id):
     """Handle folder archive download"""
     account = await verify_user(event)
     if not account:
         return
 
-    folder_id = event.pattern_match.group(1).decode()
+    try:
+        # The folder was just on screen, so its name normally comes from the cache
+        try:
+            folder = await folder_cache.list_contents(event.sender_id, account, folder_id)
+            name = folder.get('name', 'Folder')
+        except Exception:
+            name = 'Folder'
+
+        msg = await outbox.respond(event, f"⏳ Preparing archive of **{name}**...")
+        job = archive_jobs.submit(event.sender_id, account, folder_id, name, msg.chat_id, msg.id)
+        text, buttons = render_archive_job(job)
+        await outbox.edit_message(client, msg.chat_id, msg.id, text, buttons=buttons)
+    except Exception as e:
+        await outbox.respond(event, f"❌ Error: {str(e)}")
+
+
+@router.route(OP_FIND)
+@cancel_superseded
+async def find_page_callback(event, query, page=0):
+    """Show another page of /find results"""
+    account = await verify_user(event)
+    if not account:
+        return
 
     try:
-        msg = await event.respond("⏳ Creating ZIP archive... (This may take minutes for large folders)")
-        response = account.createArchive(folderId=folder_id)
-
-        if response.get('archive_url'):
-            folder = account.listContents(folderId=folder_id)
-            buttons = [
-                [Button.url("📦 Download Archive", response['archive_url'])],
-                [Button.inline("🔄 Refresh", f"download_folder_{folder_id}")]
-            ]
-
-            await msg.edit(
-                f"✅ **{folder.get('name', 'Folder')} Archive Ready**\n"
-                f"🔗 {response['archive_url']}\n\n"
-                f"⚠️ Link expires in 24 hours",
-                buttons=buttons
-            )
-        else:
-            await msg.edit("❌ Failed to create archive")
+        results = (await file_index.ensure(event.sender_id, account)).search(query)
+        msg, buttons = render_search_results(query, results, int(page))
+        await outbox.edit(event, msg, buttons=buttons)
+    except errors.MessageNotModifiedError:
+        await event.answer()
     except Exception as e:
-        await event.respond(f"❌ Error: {str(e)}")
+        await outbox.respond(event, f"❌ Error: {str(e)}")
 
 
-@client.on(events.CallbackQuery(pattern=b'delete_file_(.*)'))
-async def delete_file_callback(event):
-    """Handle file deletion"""
+@router.route(OP_EXPORT_LINKS)
+async def export_links_callback(event, folder_id):
+    """Send a direct link for every file in a folder as an aria2c input file"""
     account = await verify_user(event)
     if not account:
         return
 
-    file_id = event.pattern_match.group(1).decode()
+    try:
+        msg = await outbox.respond(event, "⏳ Generating download links for every file...")
+        export = await export_folder_links(
+            lambda fid: folder_cache.list_contents(event.sender_id, account, fid),
+            account, folder_id, concurrency=EXPORT_CONCURRENCY
+        )
+
+        if not export.entries:
+            await outbox.edit_message(client, msg.chat_id, msg.id, "❌ Couldn't generate any download links")
+            return
+
+        manifest = io.BytesIO(export.aria2_manifest().encode())
+        manifest.name = f"{export.name}.aria2.txt"
+        caption = (
+            f"🔗 **{export.name}**: {len(export.entries)} links, "
+            f"{export.total_size / (1024 ** 3):.2f}GB\n"
+            f"Download with `aria2c -c -j 4 -i \"{manifest.name}\"`\n"
+            f"⚠️ Links expire in 24 hours"
+        )
+        if export.failed:
+            caption += f"\n❌ {len(export.failed)} files or folders failed (listed at the end of the file)"
+        await outbox.send_file(client, event.chat_id, manifest, caption=caption)
+        await outbox.edit_message(client, msg.chat_id, msg.id, "✅ Download links ready")
+    except Exception as e:
+        await outbox.respond(event, f"❌ Error: {str(e)}")
+
+
+@router.route(OP_DELETE_FILE)
+async def delete_file_callback(event, file_id):
+    """Handle file deletion"""
+    account = await verify_user(event)
+    if not account:
+        return
 
     try:
-        response = account.deleteFile(fileId=file_id)
+        link_cache.discard(event.sender_id, file_id)
+        response = await account.deleteFile(fileId=file_id)
         if response.get('result'):
-            await event.edit("🗑️ File deleted successfully!")
+            await outbox.edit(event, "🗑️ File deleted successfully!")
         else:
-            await event.respond("❌ Failed to delete file")
+            await outbox.respond(event, "❌ Failed to delete file")
     except Exception as e:
-        await event.respond(f"❌ Error: {str(e)}")
+        await outbox.respond(event, f"❌ Error: {str(e)}")
 
 
-@client.on(events.CallbackQuery(data=b'refresh_folders'))
+@router.route(OP_REFRESH_FOLDERS)
 async def refresh_folders_callback(event):
     """Refresh folder list"""
-    await list_folders_callback(event)
+    await list_folders_callback(event, refresh=True)
 
 
-@client.on(events.CallbackQuery(pattern=b'refresh_files_(.*)'))
-async def refresh_files_callback(event):
+@router.route(OP_REFRESH_FOLDER)
+async def refresh_files_callback(event, folder_id):
     """Refresh file list"""
-    await folder_contents_callback(event)
+    await folder_contents_callback(event, folder_id, refresh=True)
+
+
+@router.route(OP_NOOP)
+async def noop_callback(event):
+    """Acknowledge a press of a button that has nothing to do (the page indicator)"""
+    await event.answer()
+
+
+@router.route(OP_MAIN_MENU)
+async def main_menu_callback(event):
+    """Show the main menu again"""
+    await start_handler(event)
+
+
+@client.on(events.CallbackQuery)
+async def callback_dispatcher(event):
+    """Route every inline button press through the callback router"""
+    if not await router.dispatch(event):
+        await event.answer("⌛ This button has expired. Please open the menu again.", alert=True)
 
 #DEBUG HANDLER
 @client.on(events.NewMessage(pattern='/debug'))
+@instrumented
 async def debug_handler(event):
     """Debug command to check API response structure"""
     account = await verify_user(event)
@@ -697,11 +1160,11 @@ async def debug_handler(event):
 
     try:
         # Get root folder contents as sample
-        response = account.listContents(contentType='folder')
+        response = await account.listContents(contentType='folder')
         folders = response.get('folders', [])
 
         if not folders:
-            await event.respond("📂 👾 Your Seedr account has no folders yet.")
+            await outbox.respond(event, "📂 👾 Your Seedr account has no folders yet.")
             return
 
         # Format the response for display
@@ -720,10 +1183,146 @@ async def debug_handler(event):
             for key, value in sample_file.items():
                 debug_msg += f"- {key}: {type(value).__name__}\n"
 
-        await event.respond(debug_msg)
+        pool = seedr_executor.stats()
+        debug_msg += (
+            f"\n👾 Seedr Pool: {pool['running']}/{pool['max_workers']} busy, "
+            f"{pool['queued']} queued (peak {pool['peak_in_flight']})\n"
+            f"👾 Calls: {pool['completed']} ok, {pool['failed']} failed, "
+            f"{pool['timed_out']} timed out, {pool['cancelled']} cancelled\n"
+        )
+        calls = seedr_calls.stats()
+        debug_msg += f"👾 Single-flight: {calls['issued']} issued, {calls['coalesced']} coalesced\n"
+        warm = session_cache.last_prewarm
+        if warm:
+            debug_msg += (
+                f"👾 Pre-warm: {warm['valid']}/{warm['total']} sessions ({warm['success_rate'] * 100:.0f}%) "
+                f"in {warm['seconds']:.1f}s, {warm['rejected']} revoked\n"
+            )
+        tokens = auth_manager.token_cache.stats()
+        debug_msg += f"👾 Token Cache: {tokens['hits']} hits, {tokens['misses']} misses\n"
+        sends = outbox.stats()
+        debug_msg += (
+            f"👾 Outbox: {sends['depth']} queued, avg wait {sends['avg_wait'] * 1000:.0f} ms, "
+            f"{sends['coalesced']} edits coalesced, {sends['flood_waits']} flood waits\n"
+        )
+        gauges = expiry_service.gauges()
+        debug_msg += "👾 Live State: " + ", ".join(f"{name}={count}" for name, count in gauges.items()) + "\n"
+        listings = folder_cache.stats()
+        debug_msg += (
+            f"👾 Folder Cache: {listings['entries']} listings, {listings['bytes'] / 1024:.0f} KB, "
+            f"{listings['hits']} hits, {listings['misses']} misses\n"
+        )
+
+        index = file_index.stats()
+        debug_msg += (
+            f"👾 File Index: {index['files']} files for {index['users']} users, "
+            f"{index['crawls']} crawls, last took {index['last_crawl_time']:.1f}s\n"
+        )
+        links = link_cache.stats()
+        debug_msg += f"👾 Link Cache: {links['entries']} links, {links['hits']} hits, {links['misses']} misses\n"
+        archives = archive_jobs.stats()
+        debug_msg += (
+            f"👾 Archives: {archives['active']} active, {archives['built']} built, "
+            f"{archives['reused']} reused, {archives['joined']} joined\n"
+        )
+
+        await outbox.respond(event, debug_msg)
+    except Exception as e:
+        await outbox.respond(event, f"❌👾 Debug error: {str(e)}")
+
+async def prewarm_sessions(owns=None):
+    """Validate recently active users' tokens in the background so first clicks are fast.
+
+    `owns(user_id)` limits this to the users a worker process serves.
+    """
+    changed = auth_manager.watch_changes()
+    try:
+        started = time.monotonic()
+        # Reading and decrypting every token would stall the loop, so it runs in a thread
+        tokens = await asyncio.to_thread(auth_manager.recent_tokens, PREWARM_MAX_AGE, SESSION_CACHE_SIZE)
+        # Users who unlinked or re-linked during the read must not get their old token back
+        tokens = [(user_id, token) for user_id, token in tokens
+                  if str(user_id) not in changed and (not owns or owns(user_id))]
+        for user_id, token in tokens:
+            auth_manager.remember_token(user_id, token, ttl=SESSION_TTL)
+        result = await session_cache.prewarm(tokens, concurrency=PREWARM_CONCURRENCY)
+        print(f"Pre-warmed {result['valid']}/{result['total']} sessions "
+              f"({result['success_rate'] * 100:.0f}%) in {time.monotonic() - started:.1f}s: "
+              f"{result['rejected']} revoked, {result['failed']} failed")
+    except Exception:
+        import traceback
+        traceback.print_exc()
+    finally:
+        auth_manager.unwatch_changes(changed)
+
+
+@client.on(events.NewMessage(pattern='/profile'))
+@instrumented
+async def profile_handler(event):
+    """Admin-only diagnostics of the running process, sent back as a text file"""
+    if event.sender_id not in ADMIN_IDS:
+        return
+
+    args = event.message.text.split()
+    command = args[1].lower() if len(args) > 1 else ''
+    seconds = args[2] if len(args) > 2 and args[2].replace('.', '', 1).isdigit() else 10
+    try:
+        if command == 'cpu':
+            await outbox.respond(event, f"⏳ Profiling for {min(float(seconds), PROFILE_MAX_SECONDS):.0f}s...")
+            report = await profiler.cpu(seconds)
+        elif command == 'sample':
+            await outbox.respond(event, f"⏳ Sampling for {min(float(seconds), PROFILE_MAX_SECONDS):.0f}s...")
+            report = await profiler.sample(seconds)
+        elif command == 'mem' and len(args) > 2 and args[2] == 'start':
+            profiler.memory_start()
+            await outbox.respond(event, "🧠 tracemalloc started; baseline taken. Use `/profile mem` to diff.")
+            return
+        elif command == 'mem' and len(args) > 2 and args[2] == 'stop':
+            profiler.memory_stop()
+            await outbox.respond(event, "🧠 tracemalloc stopped")
+            return
+        elif command == 'mem':
+            report = profiler.memory_diff()
+            if report is None:
+                await outbox.respond(event, "🧠 Not tracing. Start with `/profile mem start`.")
+                return
+        elif command == 'tasks':
+            report = profiler.tasks()
+        elif command == 'lag':
+            report = profiler.lag_report()
+        else:
+            await outbox.respond(event,
+                "Usage:\n"
+                f"`/profile cpu [seconds]` - cProfile the bot (max {PROFILE_MAX_SECONDS}s)\n"
+                "`/profile sample [seconds]` - low-overhead stack sampling\n"
+                "`/profile mem start|stop` - tracemalloc baseline\n"
+                "`/profile mem` - allocations since the baseline\n"
+                "`/profile tasks` - running asyncio tasks\n"
+                "`/profile lag` - event loop lag"
+            )
+            return
+
+        document = io.BytesIO(report.encode())
+        document.name = f"profile-{command}-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+        await outbox.send_file(client, event.chat_id, document, caption=f"👾 /profile {command}")
+    except ProfilerBusy as e:
+        await outbox.respond(event, f"⏳ {str(e)}")
     except Exception as e:
-        await event.respond(f"❌👾 Debug error: {str(e)}")
+        await outbox.respond(event, f"❌👾 Profile error: {str(e)}")
 
 # Run the bot
-print("Seedr Account Manager Bot is running...")
-client.run_until_disconnected()
\ No newline at end of file
+if __name__ == '__main__':
+    if WORKERS > 1 and not TOKEN_STORE.endswith(('.db', '.sqlite', '.sqlite3')):
+        raise SystemExit("WORKERS > 1 needs a SQLite TOKEN_STORE shared by the worker processes")
+    client.start(bot_token=BOT_TOKEN)
+    if WORKERS > 1:
+        from workers import run_dispatcher
+        run_dispatcher(client, outbox, WORKERS)
+    else:
+        if PREWARM_SESSIONS:
+            client.loop.create_task(prewarm_sessions())
+        print("Seedr Account Manager Bot is running...")
+        client.run_until_disconnected()
+    seedr_executor.shutdown()
+    auth_manager.close()
+    state_backend.close()
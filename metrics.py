@@ -0,0 +1,195 @@
+import asyncio
+import collections
+import functools
+import threading
+import traceback
+from bisect import bisect_left
+from threading import get_ident
+from time import perf_counter
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Series:
+    """Latency histogram, error count and in-flight count of one (kind, name)"""
+    __slots__ = ('counts', 'sum', 'count', 'errors', 'in_flight')
+
+    def __init__(self, size):
+        self.counts = [0] * (size + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+        self.in_flight = 0
+
+
+class Metrics:
+    """Latency histograms, error counters and in-flight gauges keyed by (kind, name).
+
+    `kind` says what was measured (handler, callback, seedr, token_store) and
+    `name` which one. Recording on the thread that created the registry (the
+    event loop's) is one dict lookup and a few additions with no lock. Other
+    threads, such as the token store's flusher, append their records to a
+    queue that the owner thread folds in on its next recording or render().
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._owner = threading.get_ident()
+        self._pending = collections.deque()  # (key, in_flight change, seconds or None, error) from other threads
+        self._series = {}
+        self._gauges = []  # (metric name, callable returning {label: number})
+
+    def _get(self, key):
+        series = self._series[key] = Series(len(self.buckets))
+        return series
+
+    def begin(self, kind, name):
+        """Count a call as in flight and return its start time for end()"""
+        if get_ident() == self._owner:
+            key = (kind, name)
+            (self._series.get(key) or self._get(key)).in_flight += 1
+        else:
+            self._pending.append(((kind, name), 1, None, False))
+        return perf_counter()
+
+    def end(self, kind, name, started, error=False):
+        elapsed = perf_counter() - started
+        if get_ident() != self._owner:
+            self._pending.append(((kind, name), -1, elapsed, error))
+            return
+        if self._pending:
+            self._drain()
+        series = self._series[kind, name]  # created by begin()
+        series.in_flight -= 1
+        series.counts[bisect_left(self.buckets, elapsed)] += 1
+        series.sum += elapsed
+        series.count += 1
+        if error:
+            series.errors += 1
+
+    def observe(self, kind, name, seconds, error=False):
+        """Record a call that was timed by the caller"""
+        if get_ident() != self._owner:
+            self._pending.append(((kind, name), 0, seconds, error))
+            return
+        if self._pending:
+            self._drain()
+        key = (kind, name)
+        self._observe(self._series.get(key) or self._get(key), seconds, error)
+
+    def _drain(self):
+        pending = self._pending
+        while pending:
+            key, in_flight, seconds, error = pending.popleft()
+            series = self._series.get(key) or self._get(key)
+            series.in_flight += in_flight
+            if seconds is not None:
+                self._observe(series, seconds, error)
+
+    def _observe(self, series, seconds, error):
+        series.counts[bisect_left(self.buckets, seconds)] += 1
+        series.sum += seconds
+        series.count += 1
+        if error:
+            series.errors += 1
+
+    def instrument(self, kind):
+        """Decorator timing every call of an async function under its __name__"""
+
+        def decorator(func):
+            name = func.__name__
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = self.begin(kind, name)
+                error = True
+                try:
+                    result = await func(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    self.end(kind, name, started, error)
+
+            return wrapper
+
+        return decorator
+
+    def add_gauges(self, name, source):
+        """Export the numeric values of source() as gauge `name` labelled by key"""
+        self._gauges.append((name, source))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (call from the owner thread)"""
+        self._drain()
+        series = sorted(self._series.items())
+        latency = [(key, s.counts, s.sum, s.count) for key, s in series]
+        errors = [(key, s.errors) for key, s in series if s.errors]
+        in_flight = [(key, s.in_flight) for key, s in series]
+
+        lines = [
+            '# HELP seedr_bot_latency_seconds Time spent per handler and per Seedr/token store call',
+            '# TYPE seedr_bot_latency_seconds histogram',
+        ]
+        for (kind, name), counts, total, count in latency:
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f'seedr_bot_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'seedr_bot_latency_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'seedr_bot_latency_seconds_sum{{{labels}}} {total}')
+            lines.append(f'seedr_bot_latency_seconds_count{{{labels}}} {count}')
+
+        lines += ['# HELP seedr_bot_errors_total Calls that raised or timed out',
+                  '# TYPE seedr_bot_errors_total counter']
+        lines += [f'seedr_bot_errors_total{{kind="{kind}",name="{name}"}} {value}'
+                  for (kind, name), value in errors]
+
+        lines += ['# HELP seedr_bot_in_flight Calls currently running',
+                  '# TYPE seedr_bot_in_flight gauge']
+        lines += [f'seedr_bot_in_flight{{kind="{kind}",name="{name}"}} {value}'
+                  for (kind, name), value in in_flight]
+
+        for name, source in self._gauges:
+            try:
+                values = source()
+            except Exception:
+                traceback.print_exc()
+                continue
+            lines.append(f'# TYPE seedr_bot_{name} gauge')
+            lines += [f'seedr_bot_{name}{{key="{key}"}} {value}' for key, value in values.items()
+                      if isinstance(value, (int, float))]
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, port, host='127.0.0.1'):
+        """Serve GET /metrics over plain HTTP on the event loop"""
+
+        async def handle(reader, writer):
+            try:
+                request = await reader.readline()
+                while (await reader.readline()).strip():
+                    pass  # skip headers
+                parts = request.split()
+                if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                    status, body = b'200 OK', self.render().encode()
+                else:
+                    status, body = b'404 Not Found', b'not found\n'
+                writer.write(b'HTTP/1.1 ' + status + b'\r\n'
+                             b'Content-Type: text/plain; version=0.0.4\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                             b'Connection: close\r\n\r\n' + body)
+                await writer.drain()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# Shared by every module of the bot
+metrics = Metrics()
+instrumented = metrics.instrument('handler')
@@ -0,0 +1,75 @@
+import asyncio
+import heapq
+import itertools
+import time
+import traceback
+
+
+class PollScheduler:
+    """Runs due polls from one asyncio task, with at most `max_outstanding` in flight.
+
+    Entries are (poll_at, *item). Each due entry is polled as its own task
+    in two steps: `fetch(*item)` runs while holding one of the slots (that
+    is the Seedr call), then `handle(result, *item)` runs after the slot is
+    released, so follow-up work like editing messages never holds up other
+    polls. An entry for which `is_live(*item)` is false by the time it is
+    due, or gets a slot, is dropped. `fetch` should not raise.
+    """
+
+    def __init__(self, fetch, handle, is_live, max_outstanding=8):
+        self.fetch = fetch  # async (*item) -> result
+        self.handle = handle  # async (result, *item)
+        self.is_live = is_live  # (*item) -> bool
+        self._heap = []  # (poll_at, seq, item)
+        self._seq = itertools.count()
+        self._slots = asyncio.Semaphore(max_outstanding)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def schedule(self, poll_at, *item):
+        """Poll item at time.time() >= poll_at (call from within the event loop)"""
+        heapq.heappush(self._heap, (poll_at, next(self._seq), item))
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, item = heapq.heappop(self._heap)
+            if not self.is_live(*item):
+                continue
+            # Wait for a free slot here so a backlog never turns into a burst
+            await self._slots.acquire()
+            asyncio.ensure_future(self._poll(item))
+
+    async def _poll(self, item):
+        try:
+            if not self.is_live(*item):  # dropped while waiting for a slot
+                return
+            result = await self.fetch(*item)
+        except Exception:
+            traceback.print_exc()
+            return
+        finally:
+            self._slots.release()
+
+        try:
+            await self.handle(result, *item)
+        except Exception:
+            traceback.print_exc()
+
+    def __len__(self):
+        return len(self._heap)
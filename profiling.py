@@ -0,0 +1,168 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profiling run is requested while another one is active"""
+
+
+class Profiler:
+    """On-demand diagnostics for the running bot.
+
+    Only one CPU profile or stack sampling run can be active at a time and
+    each is capped at `max_seconds`; tracemalloc is stopped automatically
+    `memory_max_seconds` after it was started, so a forgotten session cannot
+    keep slowing the bot down.
+    """
+
+    def __init__(self, max_seconds=30, sample_interval=0.01, memory_max_seconds=300,
+                 lag_interval=0.5, lag_window=600, expiry=None):
+        self.max_seconds = max_seconds
+        self.sample_interval = max(sample_interval, 0.005)
+        self.memory_max_seconds = memory_max_seconds
+        self.lag_interval = lag_interval
+        self.expiry = expiry
+        self._busy = False
+        self._baseline = None
+        self._memory_started = None
+        self._lags = deque(maxlen=lag_window)
+
+    def _clamp(self, seconds):
+        return min(max(float(seconds), 1.0), self.max_seconds)
+
+    def _acquire(self):
+        if self._busy:
+            raise ProfilerBusy("Another profiling run is still active")
+        self._busy = True
+
+    async def cpu(self, seconds):
+        """cProfile everything the event loop thread runs for `seconds`"""
+        seconds = self._clamp(seconds)
+        self._acquire()
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+        finally:
+            self._busy = False
+
+        out = io.StringIO()
+        out.write(f"cProfile of the event loop thread for {seconds:.0f}s\n\n")
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(60)
+        stats.sort_stats('tottime').print_stats(30)
+        return out.getvalue()
+
+    async def sample(self, seconds):
+        """Sample the event loop thread's stack every `sample_interval` for `seconds`.
+
+        Cheaper than cProfile since the loop itself is never traced; the output
+        is in collapsed-stack format, ready for flamegraph tools.
+        """
+        seconds = self._clamp(seconds)
+        self._acquire()
+        loop_thread = threading.get_ident()
+        interval = self.sample_interval
+
+        def run():
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(loop_thread)
+                stack = []
+                while frame is not None and len(stack) < 40:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    stacks[';'.join(reversed(stack))] += 1
+                time.sleep(interval)
+            return stacks
+
+        try:
+            stacks = await asyncio.to_thread(run)
+        finally:
+            self._busy = False
+
+        total = sum(stacks.values()) or 1
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        lines = [f"{total} samples of the event loop thread over {seconds:.0f}s "
+                 f"(every {interval * 1000:.0f} ms)", "", "Top frames:"]
+        lines += [f"{count * 100 / total:6.1f}%  {leaf}" for leaf, count in leaves.most_common(30)]
+        lines += ["", "Collapsed stacks:"]
+        lines += [f"{stack} {count}" for stack, count in stacks.most_common()]
+        return '\n'.join(lines) + '\n'
+
+    def memory_start(self):
+        """Start tracing allocations and take the baseline snapshot"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._baseline = tracemalloc.take_snapshot()
+        self._memory_started = started = time.monotonic()
+        if self.expiry:
+            self.expiry.call_later(self.memory_max_seconds, self._memory_timeout, started)
+
+    def _memory_timeout(self, started):
+        if self._memory_started == started:
+            self.memory_stop()
+
+    def memory_diff(self, limit=40):
+        """Allocations that grew since the baseline, biggest first"""
+        if self._baseline is None or not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: {current / 1024 ** 2:.1f} MB now, {peak / 1024 ** 2:.1f} MB peak",
+                 f"Compared to the baseline taken {time.monotonic() - self._memory_started:.0f}s ago:", ""]
+        lines += [str(stat) for stat in snapshot.compare_to(self._baseline, 'lineno')[:limit]]
+        return '\n'.join(lines) + '\n'
+
+    def memory_stop(self):
+        self._baseline = None
+        self._memory_started = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def tasks(self):
+        """Every asyncio task with where it is currently suspended"""
+        tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+        out = io.StringIO()
+        out.write(f"{len(tasks)} asyncio tasks\n\n")
+        for task in tasks:
+            coro = task.get_coro()
+            out.write(f"{task.get_name()}: {getattr(coro, '__qualname__', coro)}\n")
+            task.print_stack(limit=8, file=out)
+            out.write("\n")
+        return out.getvalue()
+
+    async def monitor_lag(self):
+        """Measure how late the loop wakes up from a short sleep, forever"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            self._lags.append(max(loop.time() - expected, 0.0))
+
+    def lag_report(self):
+        if not self._lags:
+            return "No event loop lag samples yet\n"
+        lags = sorted(self._lags)
+        window = len(lags) * self.lag_interval
+        return (
+            f"Event loop lag over the last {window:.0f}s ({len(lags)} samples)\n"
+            f"latest {self._lags[-1] * 1000:.1f} ms, p50 {lags[len(lags) // 2] * 1000:.1f} ms, "
+            f"p99 {lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000:.1f} ms, "
+            f"max {lags[-1] * 1000:.1f} ms\n"
+        )
@@ -0,0 +1,301 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+
+class SeedrTimeout(Exception):
+    """Raised when a Seedr call does not finish within its timeout"""
+
+
+# Error codes Seedr returns when a token is no longer accepted
+AUTH_ERRORS = {'invalid_token', 'expired_token', 'invalid_grant', 'unauthorized'}
+
+
+# Calls that change the account's contents, so cached listings go stale
+MUTATING_METHODS = {'addTorrent', 'deleteFile', 'deleteFolder'}
+
+
+def is_auth_error(response):
+    """Check whether a Seedr API response means the token was rejected"""
+    if not isinstance(response, dict):
+        return False
+    return response.get('error') in AUTH_ERRORS or response.get('status_code') == 401
+
+
+class SeedrExecutor:
+    """Bounded thread pool that runs blocking seedrcc calls off the event loop"""
+
+    def __init__(self, max_workers=16, timeout=30):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='seedr')
+
+        # Saturation metrics; running and total_queue_wait change on pool threads, under _lock
+        self._lock = threading.Lock()
+        self.in_flight = 0  # submitted and not yet finished (queued + running)
+        self.running = 0
+        self.peak_in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.total_queue_wait = 0.0
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """Run func(*args, **kwargs) in the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        submitted_at = time.monotonic()
+
+        def call():
+            with self._lock:
+                self.total_queue_wait += time.monotonic() - submitted_at
+                self.running += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+        self.submitted += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        owner = getattr(func, '__self__', None)
+        name = f"{type(owner).__name__}.{func.__name__}" if owner is not None else func.__name__
+        started = metrics.begin('seedr', name)
+        error = True
+        try:
+            # If the awaiting handler is cancelled, wait_for cancels the pool
+            # future so calls that are still queued never reach Seedr
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self._pool, call),
+                timeout if timeout is not None else self.timeout
+            )
+            self.completed += 1
+            error = False
+            return result
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise SeedrTimeout(f"Seedr did not respond within {timeout or self.timeout}s")
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            metrics.end('seedr', name, started, error)
+
+    def stats(self):
+        """Snapshot of pool saturation metrics"""
+        with self._lock:
+            running, total_queue_wait = self.running, self.total_queue_wait
+        return {
+            'max_workers': self.max_workers,
+            'in_flight': self.in_flight,
+            'running': running,
+            'queued': max(self.in_flight - running, 0),
+            'peak_in_flight': self.peak_in_flight,
+            'utilization': running / self.max_workers,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'cancelled': self.cancelled,
+            'avg_queue_wait': total_queue_wait / self.submitted if self.submitted else 0.0,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class CallCoordinator:
+    """Single-flight coalescing and per-account concurrency limits for Seedr calls.
+
+    Concurrent identical read calls (same user, account session, method and
+    arguments) share one in-flight request; the request is only cancelled once every caller
+    waiting on it has been cancelled. Each user may have at most
+    `per_account_limit` requests running at once.
+    """
+
+    def __init__(self, per_account_limit=4):
+        self.per_account_limit = per_account_limit
+        self._in_flight = {}  # (user_id, session, method, args) -> [task, waiters]
+        self._limits = {}  # user_id -> [semaphore, holders]
+        self.issued = 0
+        self.coalesced = 0
+
+    async def call(self, user_id, method, args, kwargs, run, session=None):
+        """Await run() for (user_id, method, args, kwargs), sharing it with identical concurrent calls.
+
+        `session` identifies the account object making the call, so a call
+        made with a re-linked account never joins one made with the old token.
+        """
+        if method in MUTATING_METHODS:
+            self.issued += 1
+            return await self._limited(user_id, run)
+
+        key = (user_id, session, method, args, tuple(sorted(kwargs.items())))
+        entry = self._in_flight.get(key)
+        if entry is None:
+            self.issued += 1
+            task = asyncio.ensure_future(self._limited(user_id, run))
+            entry = self._in_flight[key] = [task, 0]
+
+            def forget(_):
+                if self._in_flight.get(key) is entry:
+                    del self._in_flight[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.coalesced += 1
+
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not entry[0].done():
+                entry[0].cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    async def _limited(self, user_id, run):
+        limit = self._limits.get(user_id)
+        if limit is None:
+            limit = self._limits[user_id] = [asyncio.Semaphore(self.per_account_limit), 0]
+        limit[1] += 1
+        try:
+            async with limit[0]:
+                return await run()
+        finally:
+            limit[1] -= 1
+            if not limit[1]:
+                del self._limits[user_id]
+
+    def stats(self):
+        return {
+            'issued': self.issued,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._in_flight),
+            'busy_accounts': len(self._limits),
+        }
+
+
+class AsyncSeedr:
+    """Async facade around a seedrcc Seedr account"""
+
+    def __init__(self, account, executor, on_auth_error=None, on_mutation=None,
+                 user_id=None, coordinator=None):
+        self.account = account
+        self.executor = executor
+        self.on_auth_error = on_auth_error
+        self.on_mutation = on_mutation
+        self.user_id = user_id
+        self.coordinator = coordinator
+
+    @property
+    def token(self):
+        return self.account.token
+
+    async def _call(self, method, *args, timeout=None, **kwargs):
+        def run():
+            return self.executor.run(getattr(self.account, method), *args, timeout=timeout, **kwargs)
+
+        try:
+            if self.coordinator:
+                # The pending call keeps self.account alive, so its id is not reused meanwhile
+                response = await self.coordinator.call(self.user_id, method, args, kwargs, run,
+                                                       session=id(self.account))
+            else:
+                response = await run()
+        finally:
+            # Even a failed or timed out mutation may have reached Seedr
+            if self.on_mutation and method in MUTATING_METHODS:
+                self.on_mutation()
+        if self.on_auth_error and is_auth_error(response):
+            self.on_auth_error()
+        return response
+
+    async def testToken(self, **kwargs):
+        return await self._call('testToken', **kwargs)
+
+    async def getMemoryBandwidth(self, **kwargs):
+        return await self._call('getMemoryBandwidth', **kwargs)
+
+    async def listContents(self, **kwargs):
+        return await self._call('listContents', **kwargs)
+
+    async def fetchFile(self, **kwargs):
+        return await self._call('fetchFile', **kwargs)
+
+    async def createArchive(self, **kwargs):
+        return await self._call('createArchive', **kwargs)
+
+    async def addTorrent(self, **kwargs):
+        return await self._call('addTorrent', **kwargs)
+
+    async def deleteFile(self, **kwargs):
+        return await self._call('deleteFile', **kwargs)
+
+    async def deleteFolder(self, **kwargs):
+        return await self._call('deleteFolder', **kwargs)
+
+
+class AsyncLogin:
+    """Async facade around a seedrcc Login used for the device-code flow"""
+
+    def __init__(self, login, executor):
+        self.login = login
+        self.executor = executor
+
+    @property
+    def token(self):
+        return self.login.token
+
+    async def getDeviceCode(self, **kwargs):
+        return await self.executor.run(self.login.getDeviceCode, **kwargs)
+
+    async def authorize(self, deviceCode, **kwargs):
+        return await self.executor.run(self.login.authorize, deviceCode, **kwargs)
+
+
+# Redraw handler tasks per (chat_id, message_id), shared by all redraw handlers
+_active_callbacks = {}
+_superseded = set()
+
+
+def cancel_superseded(handler):
+    """Cancel a redraw handler's pending Seedr calls when the user presses
+    another redraw button on the same message, since the old render is abandoned.
+
+    Only handlers that edit the pressed message in place should use this;
+    a handler that posts its own status message must be left to finish it.
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(event, *args, **kwargs):
+        key = (event.chat_id, event.message_id)
+        previous = _active_callbacks.get(key)
+        # A handler delegating to another (refresh -> list) must not cancel itself
+        if previous and previous is not asyncio.current_task() and not previous.done():
+            _superseded.add(previous)
+            previous.cancel()
+
+        task = asyncio.ensure_future(handler(event, *args, **kwargs))
+        _active_callbacks[key] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task not in _superseded:
+                raise
+        finally:
+            _superseded.discard(task)
+            if _active_callbacks.get(key) is task:
+                del _active_callbacks[key]
+
+    return wrapper
@@ -0,0 +1,234 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now=None):
+        """Seconds until a token is available"""
+        now = now or time.monotonic()
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now=None):
+        self._refill(now or time.monotonic())
+        return self.tokens >= self.burst
+
+
+class _Op:
+    __slots__ = ('factory', 'futures', 'key', 'queued_at')
+
+    def __init__(self, factory, key):
+        self.factory = factory
+        self.futures = [asyncio.get_running_loop().create_future()]
+        self.key = key
+        self.queued_at = time.monotonic()
+
+
+class _Chat:
+    __slots__ = ('ops', 'bucket', 'blocked_until', 'busy', 'scheduled')
+
+    def __init__(self, bucket):
+        self.ops = collections.deque()
+        self.bucket = bucket
+        self.blocked_until = 0.0
+        self.busy = False
+        self.scheduled = False
+
+
+def flood_wait_seconds(error):
+    """Seconds Telegram asked us to wait, if `error` is a FloodWait"""
+    if type(error).__name__.startswith('Flood'):
+        return getattr(error, 'seconds', None)
+    return None
+
+
+class Outbox:
+    """Central queue for every outgoing Telegram message and edit.
+
+    Sends are limited by a global token bucket and one bucket per chat, and
+    each chat sends in order with at most one request in flight. A FloodWait
+    pauses only the chat that got it and the request is retried afterwards.
+    An edit of a message that already has an edit waiting is merged into it,
+    so only the latest text is ever sent.
+    """
+
+    def __init__(self, global_rate=25, global_burst=30, chat_rate=1, chat_burst=3, max_concurrency=16):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_concurrency = max_concurrency
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        self._pending_edits = {}  # (chat_id, message_id) -> queued _Op
+        self._ready = []  # (ready_at, seq, chat_id)
+        self._seq = itertools.count()
+        self._active = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        # Metrics
+        self.depth = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.flood_waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    # Convenience wrappers used by the handlers
+
+    async def respond(self, event, *args, **kwargs):
+        return await self.submit(event.chat_id, lambda: event.respond(*args, **kwargs))
+
+    async def edit(self, event, *args, **kwargs):
+        return await self.submit(event.chat_id, lambda: event.edit(*args, **kwargs),
+                                 key=(event.chat_id, event.message_id))
+
+    async def edit_message(self, client, chat_id, message_id, *args, **kwargs):
+        return await self.submit(chat_id, lambda: client.edit_message(chat_id, message_id, *args, **kwargs),
+                                 key=(chat_id, message_id))
+
+    async def send_file(self, client, chat_id, *args, **kwargs):
+        return await self.submit(chat_id, lambda: client.send_file(chat_id, *args, **kwargs))
+
+    def submit(self, chat_id, factory, key=None):
+        """Queue factory() (a coroutine function doing one Telegram request) and return a future for its result.
+
+        Requests sharing a `key` replace each other while still waiting.
+        """
+        if key is not None and key in self._pending_edits:
+            op = self._pending_edits[key]
+            op.factory = factory
+            future = asyncio.get_running_loop().create_future()
+            op.futures.append(future)
+            self.coalesced += 1
+            return future
+
+        op = _Op(factory, key)
+        if key is not None:
+            self._pending_edits[key] = op
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+        chat.ops.append(op)
+        self.depth += 1
+        self._schedule(chat_id, chat)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return op.futures[0]
+
+    def _schedule(self, chat_id, chat):
+        if chat.ops and not chat.busy and not chat.scheduled:
+            chat.scheduled = True
+            heapq.heappush(self._ready, (chat.blocked_until, next(self._seq), chat_id))
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._ready or self._active >= self.max_concurrency:
+                if not self._ready:
+                    self._prune()
+                await self._wakeup.wait()
+                continue
+
+            ready_at, _, chat_id = self._ready[0]
+            chat = self._chats[chat_id]
+            now = time.monotonic()
+            delay = max(ready_at - now, chat.blocked_until - now, chat.bucket.delay(now), self._global.delay(now))
+            if delay > 0:
+                if ready_at + 0.001 < now + delay:
+                    # Re-file the chat under the time it can really send so others can go first
+                    heapq.heapreplace(self._ready, (now + delay, next(self._seq), chat_id))
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._ready)
+            chat.scheduled = False
+            op = chat.ops.popleft()
+            if op.key is not None and self._pending_edits.get(op.key) is op:
+                del self._pending_edits[op.key]
+            chat.bucket.take()
+            self._global.take()
+            chat.busy = True
+            self._active += 1
+            asyncio.ensure_future(self._send(chat_id, chat, op))
+
+    async def _send(self, chat_id, chat, op):
+        wait = time.monotonic() - op.queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.in_flight += 1
+        try:
+            result = await op.factory()
+        except Exception as e:
+            seconds = flood_wait_seconds(e)
+            if seconds is not None:
+                # Retry the same request first once the chat may send again
+                self.flood_waits += 1
+                chat.blocked_until = time.monotonic() + seconds
+                chat.ops.appendleft(op)
+                if op.key is not None:
+                    self._pending_edits.setdefault(op.key, op)
+                return
+            self.depth -= 1
+            self.failed += 1
+            for future in op.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.depth -= 1
+            self.sent += 1
+            for future in op.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            chat.busy = False
+            self._active -= 1
+            self._schedule(chat_id, chat)
+            self._wakeup.set()
+
+    def _prune(self):
+        """Forget idle chats whose bucket has fully refilled"""
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if not chat.ops and not chat.busy and chat.bucket.full(now)]:
+            del self._chats[chat_id]
+
+    def stats(self):
+        started = self.sent + self.failed
+        return {
+            'depth': self.depth,
+            'in_flight': self.in_flight,
+            'chats': len(self._chats),
+            'sent': self.sent,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'flood_waits': self.flood_waits,
+            'avg_wait': self.total_wait / started if started else 0.0,
+            'max_wait': self.max_wait,
+        }
+
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from seedrcc import Seedr
+from cache import TTLCache
+from seedr_client import AsyncSeedr, is_auth_error
+
+
+class SessionEntry:
+    __slots__ = ('account', 'token', 'validated_at', 'last_used')
+
+    def __init__(self, account, token, validated_at):
+        self.account = account
+        self.token = token
+        self.validated_at = validated_at
+        self.last_used = validated_at
+
+
+class SessionCache:
+    """Per-user cache of validated Seedr sessions.
+
+    testToken is only called again once `ttl` seconds have passed since the
+    last validation, or after a real call reported an auth error. Entries are
+    kept in least-recently-used order so idle and overflow eviction only ever
+    look at the front of the dict. Tokens Seedr explicitly rejected are
+    remembered for `rejected_ttl` seconds and fail without another call.
+    """
+
+    def __init__(self, executor, ttl=300, idle_ttl=3600, max_entries=10000, on_mutation=None,
+                 coordinator=None, rejected_ttl=86400):
+        self.executor = executor
+        self.coordinator = coordinator  # shared CallCoordinator for single-flight and per-user limits
+        self.on_mutation = on_mutation  # called with the user id after a mutating Seedr call
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._rejected = TTLCache(max_entries=max_entries, ttl=rejected_ttl)  # user_id -> rejected token
+        self.hits = 0
+        self.misses = 0
+        self.fast_failures = 0
+        self.last_prewarm = None
+
+    async def get(self, user_id, token):
+        """Return a validated AsyncSeedr for the user, or None if the token is rejected"""
+        now = time.monotonic()
+        self._evict_idle(now)
+        if self._rejected.get(user_id) == token:
+            self.fast_failures += 1
+            return None
+
+        entry = self._entries.get(user_id)
+        if entry and entry.token == token:
+            entry.last_used = now
+            self._entries.move_to_end(user_id)
+            if now - entry.validated_at < self.ttl:
+                self.hits += 1
+                return entry.account
+            account = entry.account
+        else:
+            account = AsyncSeedr(
+                Seedr(token=token), self.executor,
+                on_auth_error=lambda: self.invalidate(user_id),
+                on_mutation=(lambda: self.on_mutation(user_id)) if self.on_mutation else None,
+                user_id=user_id, coordinator=self.coordinator
+            )
+
+        self.misses += 1
+        response = await account.testToken()
+        if not response.get('result'):
+            self.invalidate(user_id)
+            if is_auth_error(response):
+                self._rejected.set(user_id, token)
+            return None
+
+        self._store(user_id, account, token, time.monotonic())
+        return account
+
+    def _store(self, user_id, account, token, validated_at):
+        entry = self._entries.get(user_id)
+        if entry and entry.account is account:
+            entry.validated_at = validated_at
+        else:
+            self._entries[user_id] = SessionEntry(account, token, validated_at)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict_idle(self, now):
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_ttl:
+                break
+            del self._entries[user_id]
+
+    async def prewarm(self, tokens, concurrency=8):
+        """Validate many (user_id, token) pairs with bounded concurrency, filling the cache"""
+        limit = asyncio.Semaphore(concurrency)
+        counts = Counter()
+
+        async def warm(user_id, token):
+            async with limit:
+                try:
+                    counts['valid' if await self.get(user_id, token) else 'rejected'] += 1
+                except Exception:
+                    counts['failed'] += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*[warm(user_id, token) for user_id, token in tokens])
+        total = len(tokens)
+        self.last_prewarm = {
+            'total': total,
+            'valid': counts['valid'],
+            'rejected': counts['rejected'],
+            'failed': counts['failed'],
+            'success_rate': counts['valid'] / total if total else 1.0,
+            'seconds': time.monotonic() - started,
+        }
+        return self.last_prewarm
+
+    def invalidate(self, user_id):
+        """Drop a user's session (unlink, re-auth or auth error)"""
+        self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'fast_failures': self.fast_failures,
+        }
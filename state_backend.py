@@ -0,0 +1,155 @@
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from cache import TTLCache
+
+
+class InProcessBackend:
+    """State kept in this process only: every namespace is a TTLCache"""
+
+    def __init__(self, expiry=None):
+        self.expiry = expiry
+
+    def namespace(self, name, ttl=60, max_entries=1024):
+        return TTLCache(max_entries=max_entries, ttl=ttl, expiry=self.expiry)
+
+    def close(self):
+        pass
+
+
+class SqliteNamespace:
+    """A TTLCache-compatible view of one namespace of a SqliteBackend.
+
+    Keys and values are pickled, so anything the bot already keeps in a
+    TTLCache can move here unchanged. Expired rows are skipped on read and
+    purged every `purge_every` writes. These calls run on the event loop, so
+    when another process holds the write lock past the backend's short busy
+    timeout a read counts as a miss and a write is dropped, like a cache would.
+    """
+
+    def __init__(self, backend, name, ttl, max_entries, purge_every=1000):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.busy = 0
+
+    def _execute(self, sql, params, default=()):
+        try:
+            return self.backend.execute(sql, params)
+        except sqlite3.OperationalError:
+            self.busy += 1  # database is locked by another worker
+            return default
+
+    def get(self, key, default=None):
+        rows = self._execute(
+            'SELECT value FROM state WHERE namespace = ? AND key = ? AND expires_at > ?',
+            (self.name, pickle.dumps(key), time.time())
+        )
+        if not rows:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(rows[0][0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._execute(
+            'INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+            (self.name, pickle.dumps(key), pickle.dumps(value), expires_at)
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self._purge()
+
+    def _purge(self):
+        now = time.time()
+        self._execute('DELETE FROM state WHERE namespace = ? AND expires_at <= ?', (self.name, now))
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            # Oldest first, the same way the LRU would have pushed them out
+            self._execute(
+                'DELETE FROM state WHERE rowid IN (SELECT rowid FROM state WHERE namespace = ? '
+                'ORDER BY expires_at LIMIT ?)', (self.name, excess)
+            )
+            self.evictions += excess
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self._execute('DELETE FROM state WHERE namespace = ? AND key = ?', (self.name, pickle.dumps(key)))
+        return value
+
+    def clear(self):
+        self._execute('DELETE FROM state WHERE namespace = ?', (self.name,))
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self._execute(
+            'SELECT COUNT(*) FROM state WHERE namespace = ? AND expires_at > ?', (self.name, time.time()),
+            default=[(0,)]
+        )[0][0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'busy': self.busy,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SqliteBackend:
+    """State shared by every process that opens the same SQLite file (WAL mode).
+
+    Setup may wait for other processes, but once running a statement only
+    waits `busy_timeout` seconds for the write lock, since it blocks the loop.
+    """
+
+    def __init__(self, storage_file='bot_state.db', busy_timeout=0.05):
+        self.storage_file = Path(storage_file)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.storage_file), check_same_thread=False, isolation_level=None,
+                                     timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            'namespace TEXT NOT NULL, '
+            'key BLOB NOT NULL, '
+            'value BLOB NOT NULL, '
+            'expires_at REAL NOT NULL, '
+            'PRIMARY KEY (namespace, key))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_state_expires_at ON state (namespace, expires_at)')
+        self._conn.execute(f'PRAGMA busy_timeout = {int(busy_timeout * 1000)}')
+
+    def execute(self, sql, params=()):
+        """Run one statement and return all of its rows"""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def namespace(self, name, ttl=60, max_entries=1024):
+        return SqliteNamespace(self, name, ttl, max_entries)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_state_backend(spec, expiry=None):
+    """'' or 'memory' keeps state in-process; a .db/.sqlite path shares it through SQLite"""
+    if not spec or spec == 'memory':
+        return InProcessBackend(expiry=expiry)
+    return SqliteBackend(spec)
@@ -0,0 +1,119 @@
+import time
+from array import array
+from collections import OrderedDict
+from cache import TTLCache
+
+
+class UsageHistory:
+    """Fixed-size ring buffer of (time, space used, bandwidth used) samples.
+
+    The columns are flat arrays, so a user's history costs 24 bytes per
+    sample no matter how long the bot runs.
+    """
+
+    __slots__ = ('times', 'space', 'bandwidth', 'start', 'count')
+
+    def __init__(self, capacity):
+        self.times = array('d', [0.0]) * capacity
+        self.space = array('q', [0]) * capacity
+        self.bandwidth = array('q', [0]) * capacity
+        self.start = 0
+        self.count = 0
+
+    def _index(self, i):
+        return (self.start + i) % len(self.times)
+
+    def append(self, when, space, bandwidth):
+        if self.count == len(self.times):
+            i = self.start
+            self.start = self._index(1)
+        else:
+            i = self._index(self.count)
+            self.count += 1
+        self.times[i] = when
+        self.space[i] = space
+        self.bandwidth[i] = bandwidth
+
+    def latest_time(self):
+        return self.times[self._index(self.count - 1)] if self.count else None
+
+    def change_since(self, since):
+        """(space delta, bandwidth delta, seconds covered) from the first sample at or after `since`"""
+        if self.count < 2:
+            return None
+        # Samples are in time order, so binary search the logical positions
+        lo, hi = 0, self.count - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self._index(mid)] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, last = self._index(lo), self._index(self.count - 1)
+        if first == last:
+            return None
+        return (self.space[last] - self.space[first],
+                self.bandwidth[last] - self.bandwidth[first],
+                self.times[last] - self.times[first])
+
+    def __len__(self):
+        return self.count
+
+
+class StorageStats:
+    """Short-lived cache of getMemoryBandwidth responses plus per-user usage history.
+
+    A fresh response is recorded as a sample at most once per
+    `sample_interval`, and trends are computed from those samples alone.
+    Histories of the least recently seen users are dropped beyond `max_users`.
+    """
+
+    def __init__(self, ttl=30, sample_interval=3600, capacity=192, max_users=5000, expiry=None):
+        self.sample_interval = sample_interval
+        self.capacity = capacity
+        self.max_users = max_users
+        self._responses = TTLCache(max_entries=max_users, ttl=ttl, expiry=expiry)
+        self._histories = OrderedDict()
+
+    async def get(self, user_id, account):
+        """Return the user's quota, calling Seedr only when the cached one is stale"""
+        response = self._responses.get(user_id)
+        if response is not None:
+            return response
+
+        response = await account.getMemoryBandwidth()
+        if isinstance(response, dict) and 'space_used' in response:
+            self._responses.set(user_id, response)
+            self._record(user_id, response)
+        return response
+
+    def _record(self, user_id, response):
+        now = time.time()
+        history = self._histories.get(user_id)
+        if history is None:
+            history = self._histories[user_id] = UsageHistory(self.capacity)
+            while len(self._histories) > self.max_users:
+                self._histories.popitem(last=False)
+        self._histories.move_to_end(user_id)
+        latest = history.latest_time()
+        if latest is None or now - latest >= self.sample_interval:
+            history.append(now, int(response['space_used']), int(response.get('bandwidth_used') or 0))
+
+    def trend(self, user_id, window):
+        """Usage change over the last `window` seconds, or None without enough samples"""
+        history = self._histories.get(user_id)
+        if history is None:
+            return None
+        return history.change_since(time.time() - window)
+
+    def invalidate(self, user_id):
+        """Drop the cached quota (files were added or deleted); the history is kept"""
+        self._responses.pop(user_id)
+
+    def __len__(self):
+        return len(self._histories)
+
+    def stats(self):
+        stats = self._responses.stats()
+        stats['histories'] = len(self._histories)
+        return stats
@@ -0,0 +1,274 @@
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from metrics import metrics
+
+
+class TokenStore:
+    """Storage backend behind AuthManager.
+
+    Entries are dicts of the form {'token': <encrypted token>, 'last_updated': <unix time>}
+    keyed by the user id as a string.
+    """
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def put(self, user_id, entry):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def items(self):
+        raise NotImplementedError
+
+    def put_many(self, entries):
+        for user_id, entry in entries.items():
+            self.put(user_id, entry)
+
+    def recent(self, since=0, limit=None):
+        """(user_id, entry) pairs saved at or after `since`, newest first"""
+        entries = sorted(((user_id, entry) for user_id, entry in self.items()
+                          if entry and entry.get('last_updated', 0) >= since),
+                         key=lambda item: item[1].get('last_updated', 0), reverse=True)
+        return entries[:limit] if limit else entries
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonTokenStore(TokenStore):
+    """The original user_tokens.json file, served from memory.
+
+    Writes are flushed by a background thread that coalesces everything saved
+    within flush_interval into a single temp-file + os.replace rewrite.
+    """
+
+    def __init__(self, storage_file='user_tokens.json', flush_interval=1.0):
+        self.storage_file = Path(storage_file)
+        self._ensure_storage_file()
+
+        self.flush_interval = flush_interval
+        self._data = self._load_data()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name='token-flusher', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _ensure_storage_file(self):
+        if not self.storage_file.exists():
+            with open(self.storage_file, 'w') as f:
+                json.dump({}, f)
+
+    def get(self, user_id):
+        return self._data.get(str(user_id))
+
+    def put(self, user_id, entry):
+        with self._lock:
+            self._data[str(user_id)] = entry
+        self._dirty.set()
+
+    def put_many(self, entries):
+        with self._lock:
+            self._data.update((str(user_id), entry) for user_id, entry in entries.items())
+        self._dirty.set()
+
+    def delete(self, user_id):
+        with self._lock:
+            if self._data.pop(str(user_id), None) is None:
+                return False
+        self._dirty.set()
+        return True
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def __len__(self):
+        return len(self._data)
+
+    def _load_data(self):
+        started = time.perf_counter()
+        try:
+            with open(self.storage_file, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+        finally:
+            metrics.observe('token_store', 'json_load', time.perf_counter() - started)
+
+    def _save_data(self, data):
+        started = time.perf_counter()
+        error = True
+        try:
+            temp_file = f"{self.storage_file}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(temp_file, self.storage_file)
+            error = False
+        finally:
+            metrics.observe('token_store', 'json_save', time.perf_counter() - started, error)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            # Let further saves pile up so they land in the same write
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                traceback.print_exc()
+
+    def flush(self):
+        """Write pending changes to disk now"""
+        with self._lock:
+            if not self._dirty.is_set():
+                return
+            self._dirty.clear()
+            # Entries are replaced, never mutated, so a shallow copy is a stable snapshot
+            snapshot = dict(self._data)
+        try:
+            with self._write_lock:
+                self._save_data(snapshot)
+        except OSError:
+            self._dirty.set()
+            raise
+
+    def close(self):
+        """Stop the write-behind thread and flush what is left"""
+        if self._closed:
+            return
+        self._closed = True
+        self._dirty.set()
+        self._flusher.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+
+class SqliteTokenStore(TokenStore):
+    """SQLite backend in WAL mode; every save is a single-row upsert"""
+
+    def __init__(self, storage_file='user_tokens.db'):
+        self.storage_file = Path(storage_file)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.storage_file), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS user_tokens ('
+            'user_id TEXT PRIMARY KEY, '
+            'token TEXT NOT NULL, '
+            'last_updated INTEGER NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_user_tokens_last_updated ON user_tokens (last_updated)'
+        )
+        self._closed = False
+        atexit.register(self.close)
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT token, last_updated FROM user_tokens WHERE user_id = ?', (str(user_id),)
+            ).fetchone()
+        if row:
+            return {'token': row[0], 'last_updated': row[1]}
+        return None
+
+    def put(self, user_id, entry):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO user_tokens (user_id, token, last_updated) VALUES (?, ?, ?)',
+                (str(user_id), entry['token'], entry['last_updated'])
+            )
+
+    def put_many(self, entries):
+        rows = [(str(user_id), entry['token'], entry.get('last_updated', 0))
+                for user_id, entry in entries.items() if entry.get('token')]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO user_tokens (user_id, token, last_updated) VALUES (?, ?, ?)',
+                    rows
+                )
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def delete(self, user_id):
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM user_tokens WHERE user_id = ?', (str(user_id),))
+        return cursor.rowcount > 0
+
+    def items(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT user_id, token, last_updated FROM user_tokens').fetchall()
+        return [(user_id, {'token': token, 'last_updated': last_updated})
+                for user_id, token, last_updated in rows]
+
+    def recent(self, since=0, limit=None):
+        # Served by idx_user_tokens_last_updated
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id, token, last_updated FROM user_tokens '
+                'WHERE last_updated >= ? ORDER BY last_updated DESC LIMIT ?',
+                (since, limit or -1)
+            ).fetchall()
+        return [(user_id, {'token': token, 'last_updated': last_updated})
+                for user_id, token, last_updated in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM user_tokens').fetchone()[0]
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            self._conn.close()
+
+
+def open_token_store(storage_file):
+    """Pick a backend from the file extension (.db/.sqlite/.sqlite3 use SQLite)"""
+    if Path(storage_file).suffix in ('.db', '.sqlite', '.sqlite3'):
+        return SqliteTokenStore(storage_file)
+    return JsonTokenStore(storage_file)
+
+
+def import_json_tokens(json_file, store):
+    """One-shot import of a user_tokens.json file into another store"""
+    with open(json_file, 'r') as f:
+        data = json.load(f)
+    entries = {user_id: entry for user_id, entry in data.items() if entry and entry.get('token')}
+    store.put_many(entries)
+    store.flush()
+    return len(entries)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python token_store.py <user_tokens.json> <user_tokens.db>")
+        sys.exit(1)
+
+    target = SqliteTokenStore(sys.argv[2])
+    count = import_json_tokens(sys.argv[1], target)
+    target.close()
+    print(f"Imported {count} tokens into {sys.argv[2]}")
@@ -0,0 +1,158 @@
+import itertools
+import time
+import traceback
+from poll_scheduler import PollScheduler
+
+
+class TrackedTorrent:
+    __slots__ = ('torrent_id', 'torrent_hash', 'name', 'chat_id', 'message_id',
+                 'progress', 'interval', 'started_at', 'last_change_at', 'seen')
+
+    def __init__(self, torrent_id, torrent_hash, name, chat_id, message_id, interval):
+        self.torrent_id = torrent_id
+        self.torrent_hash = torrent_hash
+        self.name = name
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.progress = None
+        self.interval = interval
+        self.started_at = time.time()
+        self.last_change_at = self.started_at
+        self.seen = False
+
+
+class TorrentTracker:
+    """Watches newly added torrents for all users from one background task.
+
+    Every poll of an account is a single root listing that covers all of that
+    user's tracked torrents, and at most `max_outstanding` listings are in
+    flight across all users. Torrents that make progress are polled every
+    `fast_interval` seconds; stalled ones back off towards `slow_interval`.
+    """
+
+    def __init__(self, list_root, on_progress, on_finished, fast_interval=5, slow_interval=120,
+                 backoff=1.5, max_outstanding=8, max_age=86400, grace_period=60):
+        self.list_root = list_root  # async (user_id, account) -> root listing
+        self.on_progress = on_progress  # async (tracked, torrent dict)
+        self.on_finished = on_finished  # async (tracked, status) with status 'done', 'gone' or 'timeout'
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.backoff = backoff
+        self.max_age = max_age
+        self.grace_period = grace_period
+        self._accounts = {}  # user_id -> {'account': ..., 'torrents': {torrent_id: TrackedTorrent}}
+        self._seq = itertools.count()
+        self._scheduler = PollScheduler(
+            self._list, self._handle, lambda user_id, state: self._accounts.get(user_id) is state,
+            max_outstanding=max_outstanding
+        )
+        self.polls = 0
+        self.finished = 0
+
+    def track(self, user_id, account, added, chat_id, message_id):
+        """Start tracking a torrent from an addTorrent response"""
+        torrent_id = str(added.get('user_torrent_id') or added.get('id') or '')
+        tracked = TrackedTorrent(torrent_id, added.get('torrent_hash') or added.get('hash'),
+                                 added.get('title') or added.get('name') or 'Torrent',
+                                 chat_id, message_id, self.fast_interval)
+        state = self._accounts.get(user_id)
+        if state is None:
+            state = self._accounts[user_id] = {'account': account, 'torrents': {}}
+            self._schedule(user_id, state, self.fast_interval)
+        state['account'] = account
+        state['torrents'][torrent_id or tracked.torrent_hash or str(next(self._seq))] = tracked
+        return tracked
+
+    def _schedule(self, user_id, state, delay):
+        # Entries of users that were dropped (and maybe tracked again) meanwhile are skipped
+        self._scheduler.schedule(time.time() + delay, user_id, state)
+
+    async def _list(self, user_id, state):
+        self.polls += 1
+        try:
+            return await self.list_root(user_id, state['account'])
+        except Exception:
+            return None
+
+    async def _handle(self, listing, user_id, state):
+        try:
+            if isinstance(listing, dict):
+                await self._update(state, listing)
+            else:
+                # Seedr trouble: treat every torrent as stalled for this round
+                for tracked in state['torrents'].values():
+                    tracked.interval = min(tracked.interval * self.backoff, self.slow_interval)
+        except Exception:
+            traceback.print_exc()
+
+        if self._accounts.get(user_id) is not state:
+            return  # dropped (and maybe tracked again) while polling
+        if state['torrents']:
+            self._schedule(user_id, state, min(t.interval for t in state['torrents'].values()))
+        else:
+            del self._accounts[user_id]
+
+    def drop(self, user_id):
+        """Stop tracking a user's torrents (the account was unlinked or re-linked)"""
+        state = self._accounts.pop(user_id, None)
+        if state is not None:
+            state['torrents'].clear()
+
+    async def _update(self, state, listing):
+        active = {}
+        for torrent in listing.get('torrents', []):
+            active[str(torrent.get('id'))] = torrent
+            if torrent.get('hash'):
+                active[torrent['hash']] = torrent
+
+        now = time.time()
+        for key, tracked in list(state['torrents'].items()):
+            torrent = active.get(tracked.torrent_id) or active.get(tracked.torrent_hash)
+            if torrent is None and not tracked.seen and now - tracked.started_at < self.grace_period \
+                    and not _in_folders(listing, tracked.name):
+                continue  # Seedr can take a moment to list a freshly added torrent
+            if torrent is None or _progress(torrent) >= 100:
+                # Finished torrents leave the torrent list and show up as folders
+                status = 'done' if torrent is not None or _in_folders(listing, tracked.name) else 'gone'
+                await self._finish(state, key, tracked, status)
+                continue
+            if now - tracked.started_at > self.max_age:
+                await self._finish(state, key, tracked, 'timeout')
+                continue
+
+            tracked.seen = True
+            progress = _progress(torrent)
+            if progress != tracked.progress:
+                tracked.progress = progress
+                tracked.last_change_at = now
+                tracked.interval = self.fast_interval
+                await self.on_progress(tracked, torrent)
+            else:
+                tracked.interval = min(tracked.interval * self.backoff, self.slow_interval)
+
+    async def _finish(self, state, key, tracked, status):
+        del state['torrents'][key]
+        self.finished += 1
+        await self.on_finished(tracked, status)
+
+    def stats(self):
+        return {
+            'accounts': len(self._accounts),
+            'torrents': sum(len(state['torrents']) for state in self._accounts.values()),
+            'polls': self.polls,
+            'finished': self.finished,
+        }
+
+    def __len__(self):
+        return sum(len(state['torrents']) for state in self._accounts.values())
+
+
+def _progress(torrent):
+    try:
+        return float(torrent.get('progress') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _in_folders(listing, name):
+    return any(folder.get('name') == name for folder in listing.get('folders', []))
@@ -0,0 +1,424 @@
+"""Run the bot's handlers in several worker processes.
+
+The dispatcher process owns the Telegram connection. It hashes each
+update's sender_id to one worker, so a user always lands on the same
+process and their updates arrive there in order over a single stream. Each
+worker imports main.py with its handlers and caches, runs the update, and
+sends every Telegram request back to the dispatcher, whose outbox enforces
+the flood limits for all workers together.
+
+With METRICS_PORT set, the dispatcher serves /metrics on that port and
+worker i on METRICS_PORT + 1 + i. With PREWARM_SESSIONS, each worker
+pre-warms the sessions of the users sharded to it.
+
+Usage (started by main.py when WORKERS > 1):
+    python workers.py --worker <index> <fd> --workers <count> [--setup module:function]
+"""
+import argparse
+import asyncio
+import importlib
+import itertools
+import os
+import pickle
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import traceback
+import zlib
+from collections import Counter
+
+HEADER = struct.Struct('!I')
+
+
+def shard_for(sender_id, workers):
+    """Stable worker index for a user, identical in every process and run"""
+    return zlib.crc32(str(sender_id).encode()) % workers
+
+
+async def read_frame(reader):
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def write_frame(writer, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(HEADER.pack(len(data)) + data)
+
+
+def describe_event(event):
+    """The parts of a NewMessage or CallbackQuery event the handlers read"""
+    if getattr(event, 'data', None) is not None:
+        return {'kind': 'callback', 'sender_id': event.sender_id, 'chat_id': event.chat_id,
+                'message_id': event.message_id, 'data': event.data}
+    message = event.message
+    document = message.file
+    return {'kind': 'message', 'sender_id': event.sender_id, 'chat_id': event.chat_id,
+            'message_id': getattr(message, 'id', None), 'text': message.message or '',
+            'file': (document.name, document.size) if document else None}
+
+
+class SentMessage:
+    """What a worker gets back for a message the dispatcher sent or edited"""
+
+    def __init__(self, chat_id, message_id):
+        self.chat_id = chat_id
+        self.id = message_id
+
+
+def summarize(result):
+    if result is None or isinstance(result, (bool, int, str, bytes)):
+        return result
+    if hasattr(result, 'chat_id') and hasattr(result, 'id'):
+        return SentMessage(result.chat_id, result.id)
+    return None
+
+
+def rebuild_error(name, message):
+    """Re-raise a dispatcher-side Telegram error as the same Telethon class when possible"""
+    try:
+        from telethon import errors
+        cls = getattr(errors, name, None)
+        if isinstance(cls, type) and issubclass(cls, Exception):
+            return cls(None)
+    except Exception:
+        pass
+    return RuntimeError(f"{name}: {message}")
+
+
+class Dispatcher:
+    """Spawn `workers` processes and route updates to them by sender_id"""
+
+    def __init__(self, client, outbox, workers, setup=None, restart_delay=1.0):
+        self.client = client
+        self.outbox = outbox
+        self.workers = workers
+        self.setup = setup
+        self.restart_delay = restart_delay
+        self.dispatched = Counter()
+        self.rejected = 0
+        self.restarts = 0
+        self._ids = itertools.count(1)
+        self._events = {}  # event id -> (event, worker index, future done when the worker finished it)
+        self._processes = [None] * workers
+        self._writers = [None] * workers
+        self._readers = [None] * workers
+        self._restarting = set()
+        self._stopping = False
+
+    async def start(self):
+        for index in range(self.workers):
+            await self._spawn(index)
+
+    async def _spawn(self, index):
+        parent, child = socket.socketpair()
+        command = [sys.executable, os.path.abspath(__file__), '--worker', str(index), str(child.fileno()),
+                   '--workers', str(self.workers)]
+        if self.setup:
+            command += ['--setup', self.setup]
+        self._processes[index] = subprocess.Popen(command, pass_fds=[child.fileno()])
+        child.close()
+        reader, writer = await asyncio.open_connection(sock=parent)
+        self._writers[index] = writer
+        self._readers[index] = asyncio.ensure_future(self._serve(index, reader, writer))
+
+    def _alive(self, index):
+        return self._processes[index].poll() is None and not self._writers[index].is_closing()
+
+    def dispatch(self, event):
+        """Forward an update to its user's worker; the future resolves once it was handled.
+
+        The frame is written before the first await, so updates reach the
+        worker in the order Telegram delivered them. An update for a worker
+        that died fails at once, and the worker is restarted.
+        """
+        done = asyncio.get_running_loop().create_future()
+        index = shard_for(event.sender_id, self.workers)
+        if not self._alive(index):
+            self.rejected += 1
+            self._restart(index)
+            done.set_exception(ConnectionError(f"Worker {index} is restarting"))
+            return done
+        event_id = next(self._ids)
+        self._events[event_id] = (event, index, done)
+        self.dispatched[index] += 1
+        write_frame(self._writers[index], ('event', event_id, describe_event(event)))
+        return done
+
+    async def _serve(self, index, reader, writer):
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message[0] == 'done':
+                    _, _, done = self._events.pop(message[1], (None, None, None))
+                    if done and not done.done():
+                        done.set_result(None)
+                elif message[0] == 'call':
+                    asyncio.ensure_future(self._call(writer, *message[1:]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if not self._stopping:
+                print(f"Worker {index} disconnected")
+            for event_id, (_, worker, done) in list(self._events.items()):
+                if worker == index:
+                    del self._events[event_id]
+                    if not done.done():
+                        done.set_exception(ConnectionError(f"Worker {index} is gone"))
+            self._restart(index)
+
+    def _restart(self, index):
+        if self._stopping or index in self._restarting:
+            return
+        self._restarting.add(index)
+        asyncio.ensure_future(self._respawn(index))
+
+    async def _respawn(self, index):
+        try:
+            process = self._processes[index]
+            self._writers[index].close()
+            if process.poll() is None:
+                process.kill()
+            await asyncio.to_thread(process.wait)
+            # Its reader fails the worker's pending updates before a new worker takes new ones
+            await asyncio.gather(self._readers[index], return_exceptions=True)
+            await asyncio.sleep(self.restart_delay)  # don't spin on a worker that dies at startup
+            if not self._stopping:
+                print(f"Restarting worker {index} (exit code {process.returncode})")
+                await self._spawn(index)
+                self.restarts += 1
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._restarting.discard(index)
+
+    async def _call(self, writer, call_id, event_id, method, args, kwargs):
+        try:
+            reply = ('result', call_id, True, summarize(await self._perform(event_id, method, args, kwargs)))
+        except Exception as e:
+            reply = ('result', call_id, False, (type(e).__name__, str(e)))
+        if not writer.is_closing():
+            write_frame(writer, reply)
+
+    async def _perform(self, event_id, method, args, kwargs):
+        if method == 'edit_message':
+            return await self.outbox.edit_message(self.client, *args, **kwargs)
+        if method == 'send_file':
+            return await self.outbox.send_file(self.client, *args, **kwargs)
+        event = self._events[event_id][0]
+        if method == 'respond':
+            return await self.outbox.respond(event, *args, **kwargs)
+        if method == 'edit':
+            return await self.outbox.edit(event, *args, **kwargs)
+        if method == 'answer':
+            return await event.answer(*args, **kwargs)
+        if method == 'download_media':
+            return await event.message.download_media(file=bytes)
+        raise ValueError(f"Unknown worker request {method}")
+
+    async def stop(self):
+        self._stopping = True
+        for writer in self._writers:
+            writer.close()
+        for process in self._processes:
+            process.send_signal(signal.SIGTERM)
+        for process in self._processes:
+            await asyncio.to_thread(process.wait)
+        for task in self._readers:
+            task.cancel()
+        for _, _, done in self._events.values():
+            if not done.done():
+                done.cancel()
+        self._events.clear()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'alive': sum(process.poll() is None for process in self._processes),
+            'restarts': self.restarts,
+            'rejected': self.rejected,
+            'in_flight': len(self._events),
+            'dispatched': dict(self.dispatched),
+        }
+
+
+def run_dispatcher(client, outbox, workers):
+    """Replace main.py's handlers with forwarding to `workers` processes and run until disconnected"""
+    from telethon import events
+    from metrics import metrics
+
+    for callback, builder in client.list_event_handlers():
+        client.remove_event_handler(callback, builder)
+    dispatcher = Dispatcher(client, outbox, workers)
+    metrics.add_gauges('dispatcher', dispatcher.stats)
+
+    @client.on(events.NewMessage())
+    @client.on(events.CallbackQuery())
+    async def forward(event):
+        await dispatcher.dispatch(event)
+
+    client.loop.run_until_complete(dispatcher.start())
+    print(f"Dispatching updates to {workers} workers...")
+    try:
+        client.run_until_disconnected()
+    finally:
+        client.loop.run_until_complete(dispatcher.stop())
+    return dispatcher
+
+
+# Worker side
+
+
+class WorkerLink:
+    """The worker's end of the stream: numbered calls answered by the dispatcher"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._ids = itertools.count(1)
+        self._calls = {}
+
+    async def call(self, event_id, method, args=(), kwargs=None):
+        call_id = next(self._ids)
+        future = self._calls[call_id] = asyncio.get_running_loop().create_future()
+        write_frame(self.writer, ('call', call_id, event_id, method, args, kwargs or {}))
+        return await future
+
+    def resolve(self, call_id, ok, value):
+        future = self._calls.pop(call_id, None)
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(rebuild_error(*value))
+
+
+class ProxyFile:
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+class ProxyMessage:
+    def __init__(self, link, event_id, payload):
+        self._link = link
+        self._event_id = event_id
+        self.id = payload['message_id']
+        self.message = self.text = payload['text']
+        self.file = ProxyFile(*payload['file']) if payload['file'] else None
+
+    async def download_media(self, file=None):
+        return await self._link.call(self._event_id, 'download_media')
+
+
+class ProxyEvent:
+    """Stands in for a Telethon event inside a worker; requests go to the dispatcher"""
+
+    def __init__(self, link, event_id, payload):
+        self._link = link
+        self._event_id = event_id
+        self.sender_id = payload['sender_id']
+        self.chat_id = payload['chat_id']
+        self.message_id = payload['message_id']
+        if payload['kind'] == 'callback':
+            self.data = payload['data']
+        else:
+            self.message = ProxyMessage(link, event_id, payload)
+            self.raw_text = self.text = payload['text']
+
+    async def respond(self, *args, **kwargs):
+        return await self._link.call(self._event_id, 'respond', args, kwargs)
+
+    async def edit(self, *args, **kwargs):
+        return await self._link.call(self._event_id, 'edit', args, kwargs)
+
+    async def answer(self, *args, **kwargs):
+        return await self._link.call(self._event_id, 'answer', args, kwargs)
+
+
+def matching_handlers(client, event):
+    """The registered handlers Telethon would run for this update, in registration order"""
+    kind = 'CallbackQuery' if hasattr(event, 'data') else 'NewMessage'
+    handlers = []
+    for callback, builder in client.list_event_handlers():
+        if type(builder).__name__ != kind:
+            continue
+        pattern = getattr(builder, 'pattern', None)
+        if pattern and kind == 'NewMessage' and not pattern(event.message.message):
+            continue
+        func = getattr(builder, 'func', None)
+        if func and not func(event):
+            continue
+        handlers.append(callback)
+    return handlers
+
+
+async def serve_worker(bot, sock):
+    reader, writer = await asyncio.open_connection(sock=sock)
+    link = WorkerLink(writer)
+    # Background work (progress trackers, archive jobs) edits messages through the client
+    bot.client.edit_message = lambda *args, **kwargs: link.call(None, 'edit_message', args, kwargs)
+    bot.client.send_file = lambda *args, **kwargs: link.call(None, 'send_file', args, kwargs)
+
+    async def handle(event_id, payload):
+        event = ProxyEvent(link, event_id, payload)
+        try:
+            for handler in matching_handlers(bot.client, event):
+                try:
+                    await handler(event)
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            write_frame(writer, ('done', event_id))
+
+    while True:
+        try:
+            message = await read_frame(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        if message[0] == 'event':
+            # Started in arrival order; like the single-process bot, a user's
+            # handlers may overlap so a newer button press can supersede an older one
+            asyncio.ensure_future(handle(*message[1:]))
+        elif message[0] == 'result':
+            link.resolve(*message[1:])
+
+
+def load_main():
+    import main
+    return main
+
+
+def worker_main(index, fd, setup=None, workers=1):
+    # The dispatcher owns the Telegram session and the real flood limits
+    os.environ['TELEGRAM_SESSION'] = ''
+    os.environ['SEND_GLOBAL_RATE'] = os.environ['SEND_CHAT_RATE'] = '1000000'
+    # The dispatcher serves METRICS_PORT itself; each worker takes the next free port
+    metrics_port = int(os.environ.get('METRICS_PORT') or 0)
+    os.environ['METRICS_PORT'] = str(metrics_port + 1 + index) if metrics_port else '0'
+    if setup:
+        module, function = setup.split(':')
+        bot = getattr(importlib.import_module(module), function)()
+    else:
+        bot = load_main()
+    sock = socket.socket(fileno=fd)
+    loop = bot.client.loop
+    if getattr(bot, 'PREWARM_SESSIONS', False):
+        loop.create_task(bot.prewarm_sessions(owns=lambda user_id: shard_for(user_id, workers) == index))
+    try:
+        loop.run_until_complete(serve_worker(bot, sock))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bot.seedr_executor.shutdown()
+        bot.auth_manager.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Worker process of the multi-process bot")
+    parser.add_argument('--worker', nargs=2, type=int, metavar=('INDEX', 'FD'), required=True)
+    parser.add_argument('--workers', type=int, default=1, help="number of workers users are sharded across")
+    parser.add_argument('--setup', help="module:function returning the bot module (default: import main)")
+    args = parser.parse_args()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    worker_main(*args.worker, setup=args.setup, workers=args.workers)